@@ -0,0 +1,285 @@
+"""Measures order execution, database, logging and console performance.
+
+Everything runs in this process against the simulated broker, with a
+temporary config.py, database and log directory that are removed
+afterwards, so nothing is sent to Robinhood and the real database is
+not touched. Results are printed as JSON so runs can be compared.
+
+Run from the tradebox directory:
+python benchmarks/execution.py --runs 5
+python benchmarks/execution.py --benchmark db --benchmark log
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+TRADEBOX_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARKS = ('execute_order', 'db', 'log', 'console_orders')
+CONSOLE_ORDER_COUNTS = (10, 1_000, 100_000)
+
+CONTRACT = ('SPY', '2030-01-18', 500.0, 'call')
+
+
+def use_temporary_config(temp_dir: str, latency: float) -> None:
+    """Write config.py into temp_dir and import Tradebox modules with it."""
+    with open(os.path.join(TRADEBOX_DIR, 'config-default-must-rename.py'), encoding='utf-8') as f:
+        config_source = f.read()
+
+    # later assignments override the defaults above them
+    overrides = {
+        'DATABASE_DIR': temp_dir,
+        'LOG_PARENT_DIR': temp_dir,
+        'BROKER': 'simulated',
+        'SIMULATED_BROKER_LATENCY_SECONDS': latency,
+        'SIMULATED_BROKER_FILL_DELAY_SECONDS': 0.0,
+        'SIMULATED_BROKER_PARTIAL_FILL_RATE': 0.5,
+        'SIMULATED_BROKER_REJECT_RATE': 0.0,
+        'SIMULATED_BROKER_SEED': 1,
+    }
+    config_source += '\n\n# benchmark overrides\n' + ''.join(
+        f'{name} = {value!r}\n' for name, value in overrides.items()
+    )
+    with open(os.path.join(temp_dir, 'config.py'), 'w', encoding='utf-8') as f:
+        f.write(config_source)
+
+    sys.path[:0] = [temp_dir, TRADEBOX_DIR]
+
+
+def summarize(timings_ms: list) -> dict:
+    timings_ms = sorted(timings_ms)
+    return {
+        'runs': len(timings_ms),
+        'median_ms': round(statistics.median(timings_ms), 3),
+        'p95_ms': round(timings_ms[min(int(len(timings_ms) * 0.95), len(timings_ms) - 1)], 3),
+        'min_ms': round(timings_ms[0], 3),
+        'max_ms': round(timings_ms[-1], 3),
+    }
+
+
+def rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds > 0 else None
+
+
+def create_market_order(buy_sell: str, quantity: int) -> int:
+    import tradeapi
+
+    return tradeapi.create_order(
+        buy_sell, *CONTRACT, quantity, 'market',
+        False, True, '', '', None, None, 10,
+    )
+
+
+def benchmark_execute_order(runs: int) -> dict:
+    import log
+    import tradeapi
+
+    timings_ms = {'buy': [], 'sell': []}
+    for _ in range(runs):
+        for buy_sell in ('buy', 'sell'):
+            order_id = create_market_order(buy_sell, 5)
+            start = time.perf_counter()
+            tradeapi.execute_order(order_id)
+            timings_ms[buy_sell].append((time.perf_counter() - start) * 1000)
+
+    log.flush()
+    spans = []
+    for trace_path in glob.glob(os.path.join(log.LOG_DIR, 'trace-*.jsonl')):
+        with open(trace_path, encoding='utf-8') as f:
+            spans.extend(json.loads(line) for line in f)
+
+    # time spent in each attempt of the market loops outside of
+    # waiting for the broker to fill or settle an order
+    attempts = {}
+    for span in spans:
+        if span['attempt'] is None:
+            continue
+        attempt = attempts.setdefault((span['order_id'], span['attempt']), {'start': None, 'end': None, 'waiting_ms': 0.0})
+        end = span['started_at'] + span['duration_ms'] / 1000
+        attempt['start'] = span['started_at'] if attempt['start'] is None else min(attempt['start'], span['started_at'])
+        attempt['end'] = end if attempt['end'] is None else max(attempt['end'], end)
+        if span['span'] in ('wait_for_fill', 'wait_for_settlement'):
+            attempt['waiting_ms'] += span['duration_ms']
+
+    attempt_overhead_ms = [
+        (attempt['end'] - attempt['start']) * 1000 - attempt['waiting_ms']
+        for attempt in attempts.values()
+    ]
+
+    span_durations_ms = {}
+    for span in spans:
+        span_durations_ms.setdefault(span['span'], []).append(span['duration_ms'])
+
+    return {
+        'buy': summarize(timings_ms['buy']),
+        'sell': summarize(timings_ms['sell']),
+        'attempts': len(attempts),
+        'attempt_overhead': summarize(attempt_overhead_ms) if attempt_overhead_ms else None,
+        'spans': {name: summarize(durations) for name, durations in sorted(span_durations_ms.items())},
+    }
+
+
+def benchmark_db(operations: int) -> dict:
+    import db
+    import jobs
+
+    instrument_order_id = create_market_order('buy', 1)
+    order = db.get_order(instrument_order_id)
+
+    def insert_order(execute_only_after_id: int):
+        return db.insert_order(
+            'buy', order.symbol, order.expiration_date, order.strike, order.call_put, 1, 'market',
+            False, True, '', '', execute_only_after_id, None, 10, 0.0, order.rh_option_uuid,
+            order.below_tick, order.above_tick, order.cutoff_price,
+        )
+
+    results = {}
+
+    def measure(name: str, func, arguments: list) -> None:
+        start = time.perf_counter()
+        for argument in arguments:
+            func(argument)
+        elapsed = time.perf_counter() - start
+        results[name] = {'operations': len(arguments), 'ops_per_second': rate(len(arguments), elapsed)}
+
+    # each order waits on the one before it, so claims check a prerequisite
+    # and releases find a dependent, as chained orders do in execute_order
+    order_ids = [instrument_order_id]
+    measure('insert_order', lambda _: order_ids.append(insert_order(order_ids[-1])), range(operations))
+    order_ids = order_ids[1:]
+    job_ids = [f'benchmark-{order_id}' for order_id in order_ids]
+
+    measure('get_order', db.get_order, order_ids)
+    db.claim_order(instrument_order_id)
+    measure('claim_order', db.claim_order, order_ids)
+    measure('fetch_released_order_ids', db.fetch_released_order_ids, order_ids)
+    measure('insert_job', lambda job_id: db.insert_job(job_id, order_ids[0]), job_ids)
+    measure('update_job', lambda job_id: db.update_job(job_id, status='running', phase='buying'), job_ids)
+    measure('fetch_job', jobs.get, job_ids)
+    # effectively unlimited, so this measures the shared bucket's overhead per broker call
+    measure('take_rate_limit_token', lambda _: db.take_rate_limit_token('benchmark', 1e9, 1e9), order_ids)
+    return results
+
+
+def benchmark_log(messages: int) -> dict:
+    import log
+
+    message = 'Benchmark log message ' + 'x' * 100
+    log.flush()
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        log.append(message)
+    enqueued = time.perf_counter() - start
+    log.flush(timeout=120.0)
+    written = time.perf_counter() - start
+
+    return {
+        'messages': messages,
+        'append_per_second': rate(messages, enqueued),
+        'append_us': round(enqueued / messages * 1_000_000, 3),
+        'written_per_second': rate(messages, written),
+    }
+
+
+def benchmark_console_orders(runs: int) -> dict:
+    import db
+
+    try:
+        import pandas  # noqa: F401
+    except ImportError as e:
+        return {'skipped': str(e)}
+
+    template = db.get_order(create_market_order('buy', 1))
+    results = {}
+    for order_count in CONSOLE_ORDER_COUNTS:
+        conn = db.connection()
+        with conn:
+            conn.execute("DELETE FROM orders;")
+            conn.executemany(
+                "INSERT INTO orders(active, created_at, executed, buy_sell, symbol, strike, call_put, "
+                "expiration_date, rh_option_uuid, market_limit, limit_price, quantity, below_tick, "
+                "above_tick, cutoff_price, max_order_attempts, emergency_order_fill_on_failure) "
+                "VALUES (1, datetime('now'), 0, 'buy', ?, ?, ?, ?, ?, 'market', 0, 1, ?, ?, ?, 10, 0);",
+                [
+                    (template.symbol, template.strike, template.call_put, template.expiration_date,
+                     template.rh_option_uuid, template.below_tick, template.above_tick, template.cutoff_price)
+                ] * order_count,
+            )
+
+        query_ms = []
+        render_ms = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            orders_dataframe = db.get_console_formatted_orders_dataframe()
+            queried = time.perf_counter()
+            orders_dataframe.to_string()
+            rendered = time.perf_counter()
+            query_ms.append((queried - start) * 1000)
+            render_ms.append((rendered - queried) * 1000)
+
+        results[str(order_count)] = {
+            'dataframe': summarize(query_ms),
+            'to_string': summarize(render_ms),
+        }
+    return results
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict:
+    import db
+    db.create_orders_table()
+    if args.quote_feed:
+        import quotes
+        quotes.start_feed()
+
+    benchmarks = args.benchmark or BENCHMARKS
+    results = {}
+    for name in BENCHMARKS:
+        if name not in benchmarks:
+            continue
+        if name == 'execute_order':
+            results[name] = benchmark_execute_order(args.runs)
+        elif name == 'db':
+            results[name] = benchmark_db(args.db_operations)
+        elif name == 'log':
+            results[name] = benchmark_log(args.log_messages)
+        elif name == 'console_orders':
+            results[name] = benchmark_console_orders(args.runs)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--benchmark', choices=BENCHMARKS, action='append')
+    parser.add_argument('--db-operations', type=int, default=2000)
+    parser.add_argument('--log-messages', type=int, default=100_000)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated broker latency per call in seconds')
+    parser.add_argument('--quote-feed', action='store_true', help='run the background quote feed during the benchmarks')
+    args = parser.parse_args()
+
+    # the database, logs and traces are removed when the benchmarks finish
+    with tempfile.TemporaryDirectory(prefix='tradebox-benchmark-', ignore_cleanup_errors=True) as temp_dir:
+        use_temporary_config(temp_dir, args.latency)
+        results = run_benchmarks(args)
+
+        import log
+        log.flush()
+
+    print(json.dumps({
+        'benchmark': 'execution',
+        'python': sys.version.split()[0],
+        'broker_latency_seconds': args.latency,
+        'quote_feed': args.quote_feed,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
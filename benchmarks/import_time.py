@@ -0,0 +1,112 @@
+"""Measures cold start time of the WSGI app and the console.
+
+Each target is imported in a fresh Python process so that nothing is
+cached between runs. The processes use a temporary config.py, database
+and log directory with the simulated broker, so a timing run never
+touches the real database or Robinhood account. Results are printed
+as JSON.
+
+Run from the tradebox directory:
+python benchmarks/import_time.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TRADEBOX_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'wsgi': 'import wsgi',
+    'console': 'import console',
+}
+
+
+def write_temporary_config(temp_dir: str) -> None:
+    with open(os.path.join(TRADEBOX_DIR, 'config-default-must-rename.py'), encoding='utf-8') as f:
+        config_source = f.read()
+
+    # later assignments override the defaults above them
+    overrides = {
+        'DATABASE_DIR': temp_dir,
+        'LOG_PARENT_DIR': temp_dir,
+        'BROKER': 'simulated',
+    }
+    config_source += '\n\n# benchmark overrides\n' + ''.join(
+        f'{name} = {value!r}\n' for name, value in overrides.items()
+    )
+    with open(os.path.join(temp_dir, 'config.py'), 'w', encoding='utf-8') as f:
+        f.write(config_source)
+
+
+def time_import(statement: str, temp_dir: str) -> tuple[float, list]:
+    # '-c' puts the working directory first on sys.path, so the temporary
+    # config.py is imported instead of the one in the tradebox directory
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [TRADEBOX_DIR, os.environ.get('PYTHONPATH')])))
+    start = time.perf_counter()
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=temp_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    # nested imports are indented two spaces per level
+    direct_imports = []
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            direct_imports.append((name.strip(), int(cumulative) / 1000))
+
+    return elapsed_ms, direct_imports
+
+
+def benchmark(target: str, runs: int, temp_dir: str) -> dict:
+    timings = []
+    direct_imports = []
+    for _ in range(runs):
+        elapsed_ms, direct_imports = time_import(TARGETS[target], temp_dir)
+        timings.append(elapsed_ms)
+
+    slowest_imports = sorted(direct_imports, key=lambda item: item[1], reverse=True)[:10]
+
+    return {
+        'runs': runs,
+        'median_ms': round(statistics.median(timings), 2),
+        'min_ms': round(min(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'slowest_imports_ms': {name: round(ms, 2) for name, ms in slowest_imports},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--target', choices=sorted(TARGETS), action='append')
+    args = parser.parse_args()
+
+    targets = args.target or sorted(TARGETS)
+    with tempfile.TemporaryDirectory(prefix='tradebox-import-time-') as temp_dir:
+        write_temporary_config(temp_dir)
+        results = {
+            'benchmark': 'import_time',
+            'python': sys.version.split()[0],
+            'results': {target: benchmark(target, args.runs, temp_dir) for target in targets},
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
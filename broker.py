@@ -0,0 +1,492 @@
+"""Provides the brokerage operations Tradebox uses.
+
+get() returns the broker selected by config.BROKER:
+'robinhood' trades through robin_stocks, and 'simulated' runs an
+in-process market so order execution can be exercised and profiled
+without a live account. Both return data in Robinhood's JSON shapes
+(prices as strings, order states such as 'filled' and 'cancelled').
+
+The simulated broker keeps its state in memory, so each server worker
+has its own simulated account.
+"""
+
+import abc
+import datetime
+import functools
+import random
+import threading
+import time
+import uuid
+
+import config
+import lazy
+import ratelimit
+import session
+
+OPEN_ORDER_STATES = ('queued', 'unconfirmed', 'confirmed', 'partially_filled')
+
+_broker = None
+_broker_lock = threading.Lock()
+_login_local = threading.local()
+
+
+class LoginPromptError(Exception):
+    """A login that must not prompt asked for input."""
+
+
+def _guarded_input(prompt: str = '') -> str:
+    if getattr(_login_local, 'prompt', True) is False:
+        raise LoginPromptError(f'Robinhood login asked for input: {prompt!r}')
+    return input(prompt)
+
+
+def get() -> 'Broker':
+    global _broker
+
+    if _broker is not None:
+        return _broker
+
+    with _broker_lock:
+        if _broker is None:
+            if config.BROKER == 'simulated':
+                _broker = SimulatedBroker(
+                    latency=config.SIMULATED_BROKER_LATENCY_SECONDS,
+                    fill_delay=config.SIMULATED_BROKER_FILL_DELAY_SECONDS,
+                    partial_fill_rate=config.SIMULATED_BROKER_PARTIAL_FILL_RATE,
+                    reject_rate=config.SIMULATED_BROKER_REJECT_RATE,
+                    seed=config.SIMULATED_BROKER_SEED,
+                )
+            elif config.BROKER == 'robinhood':
+                _broker = RobinhoodBroker()
+            else:
+                raise ValueError(f"config.BROKER must be 'robinhood' or 'simulated', not {config.BROKER!r}")
+        return _broker
+
+
+class Broker(abc.ABC):
+    name = None
+
+    @abc.abstractmethod
+    def login(self, username: str, password: str, expires_in: int, mfa_code=None,
+              pickle_name: str = '', prompt: bool = True) -> dict:
+        """Log in, storing the session under pickle_name.
+
+        With prompt=False, a login that would ask for input (an MFA
+        code, for example) raises LoginPromptError instead.
+        """
+
+    @abc.abstractmethod
+    def logout(self) -> None:
+        """Log out and forget the stored session."""
+
+    @abc.abstractmethod
+    def get_option_instrument(self, symbol: str, expiration_date: str, strike: float, call_put: str) -> dict:
+        """Return instrument data for a contract, or None if it does not exist."""
+
+    @abc.abstractmethod
+    def get_option_instrument_by_id(self, option_id: str) -> dict:
+        """Return instrument data for an option id, or None if it does not exist."""
+
+    @abc.abstractmethod
+    def get_quote(self, option_id: str) -> dict:
+        """Return market data (bid_price, ask_price, adjusted_mark_price, ...) for one option."""
+
+    @abc.abstractmethod
+    def get_quotes(self, instrument_urls: list) -> list:
+        """Return market data for several options in one request. Failed entries are None."""
+
+    @abc.abstractmethod
+    def get_open_positions(self) -> list:
+        """Return the open option positions. A failed request returns None or [None]."""
+
+    @abc.abstractmethod
+    def buy_option_limit(self, position_effect: str, credit_or_debit: str, price: float, symbol: str,
+                         quantity: int, expiration_date: str, strike: float, option_type: str,
+                         time_in_force: str = 'gtc') -> dict:
+        """Place a limit order to buy. Returns the order data, with its 'id'."""
+
+    @abc.abstractmethod
+    def sell_option_limit(self, position_effect: str, credit_or_debit: str, price: float, symbol: str,
+                          quantity: int, expiration_date: str, strike: float, option_type: str,
+                          time_in_force: str = 'gtc') -> dict:
+        """Place a limit order to sell. Returns the order data, with its 'id'."""
+
+    @abc.abstractmethod
+    def get_order(self, order_id: str) -> dict:
+        """Return the current data of a broker order, including its 'state'."""
+
+    @abc.abstractmethod
+    def cancel_order(self, order_id: str) -> dict:
+        """Ask the broker to cancel an order."""
+
+    @abc.abstractmethod
+    def cancel_all_orders(self) -> None:
+        """Cancel every open option order of the account."""
+
+
+class RobinhoodBroker(Broker):
+    """Calls robin_stocks within the shared rate limits, logging in again once on auth errors."""
+    name = 'robinhood'
+
+    def __init__(self) -> None:
+        self._r = lazy.LazyModule('robin_stocks.robinhood')
+        self._hook_installed = False
+        self._hook_lock = threading.Lock()
+
+    def _call(self, endpoint: str, func, *args, **kwargs):
+        self._install_response_hook()
+
+        # the retry after an auth error is a request too, so it takes its own token
+        @functools.wraps(func)
+        def rate_limited(*args, **kwargs):
+            return ratelimit.call(endpoint, func, *args, **kwargs)
+
+        return session.call(rate_limited, *args, **kwargs)
+
+    def _install_response_hook(self) -> None:
+        # robin_stocks swallows HTTP errors on GET requests, so throttled
+        # responses are noted from its requests session instead
+        if self._hook_installed:
+            return
+        with self._hook_lock:
+            if self._hook_installed:
+                return
+            http_session = getattr(self._r.helper, 'SESSION', None)
+            if http_session is not None:
+                http_session.hooks['response'].append(ratelimit.record_response)
+            self._hook_installed = True
+
+    def login(self, username: str, password: str, expires_in: int, mfa_code=None,
+              pickle_name: str = '', prompt: bool = True) -> dict:
+        self._install_response_hook()
+        self._install_prompt_guard()
+        _login_local.prompt = prompt
+        try:
+            return ratelimit.call(
+                'auth', self._r.login, username, password,
+                expiresIn=expires_in, mfa_code=mfa_code, pickle_name=pickle_name,
+            )
+        finally:
+            _login_local.prompt = True
+
+    def _install_prompt_guard(self) -> None:
+        # robin_stocks asks for codes with input(); background logins must not wait on it
+        authentication = self._r.authentication
+        if getattr(authentication, 'input', None) is not _guarded_input:
+            authentication.input = _guarded_input
+
+    def logout(self) -> None:
+        self._r.logout()
+
+    def get_option_instrument(self, symbol: str, expiration_date: str, strike: float, call_put: str) -> dict:
+        instrument_data = self._call(
+            'instruments',
+            self._r.options.get_option_instrument_data, symbol, expiration_date, strike, call_put
+        )
+        if instrument_data is None or instrument_data == [None]:
+            return None
+        return instrument_data
+
+    def get_option_instrument_by_id(self, option_id: str) -> dict:
+        return self._call('instruments', self._r.options.get_option_instrument_data_by_id, option_id)
+
+    def get_quote(self, option_id: str) -> dict:
+        market_data = self._call('market_data', self._r.options.get_option_market_data_by_id, option_id)
+        if not market_data:
+            return None
+        return market_data[0]
+
+    def get_quotes(self, instrument_urls: list) -> list:
+        return self._call(
+            'market_data',
+            self._r.helper.request_get,
+            self._r.urls.marketdata_options_url(),
+            'results',
+            {'instruments': ','.join(instrument_urls)},
+        )
+
+    def get_open_positions(self) -> list:
+        return self._call('positions', self._r.options.get_open_option_positions)
+
+    def buy_option_limit(self, position_effect: str, credit_or_debit: str, price: float, symbol: str,
+                         quantity: int, expiration_date: str, strike: float, option_type: str,
+                         time_in_force: str = 'gtc') -> dict:
+        return self._call(
+            'orders',
+            self._r.orders.order_buy_option_limit,
+            position_effect, credit_or_debit, price, symbol, quantity, expiration_date, strike,
+            optionType=option_type, timeInForce=time_in_force,
+        )
+
+    def sell_option_limit(self, position_effect: str, credit_or_debit: str, price: float, symbol: str,
+                          quantity: int, expiration_date: str, strike: float, option_type: str,
+                          time_in_force: str = 'gtc') -> dict:
+        return self._call(
+            'orders',
+            self._r.orders.order_sell_option_limit,
+            position_effect, credit_or_debit, price, symbol, quantity, expiration_date, strike,
+            optionType=option_type, timeInForce=time_in_force,
+        )
+
+    def get_order(self, order_id: str) -> dict:
+        return self._call('order_status', self._r.orders.get_option_order_info, order_id)
+
+    def cancel_order(self, order_id: str) -> dict:
+        return self._call('cancel', self._r.orders.cancel_option_order, order_id)
+
+    def cancel_all_orders(self) -> None:
+        self._call('cancel', self._r.orders.cancel_all_option_orders)
+
+
+class SimulatedBroker(Broker):
+    """An in-process options market for offline runs and benchmarks.
+
+    Quotes follow a random walk around a per-contract starting price.
+    An order fills once fill_delay seconds have passed and its limit
+    price crosses the current quote; with probability
+    partial_fill_rate only part of the remaining quantity fills each
+    time. Orders are rejected with probability reject_rate, and when
+    selling more contracts than the account holds. Every call sleeps
+    for latency seconds.
+    """
+    name = 'simulated'
+
+    def __init__(self, latency: float = 0.0, fill_delay: float = 0.0, partial_fill_rate: float = 0.0,
+                 reject_rate: float = 0.0, seed: int = None) -> None:
+        self.latency = latency
+        self.fill_delay = fill_delay
+        self.partial_fill_rate = partial_fill_rate
+        self.reject_rate = reject_rate
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._instruments = {}  # option id -> instrument data
+        self._instrument_ids = {}  # (symbol, expiration_date, strike, call_put) -> option id
+        self._marks = {}  # option id -> current mark price
+        self._orders = {}  # order id -> order data
+        self._positions = {}  # option id -> position data
+
+    def _call(self) -> None:
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def login(self, username: str, password: str, expires_in: int, mfa_code=None,
+              pickle_name: str = '', prompt: bool = True) -> dict:
+        self._call()
+        return {'access_token': 'simulated', 'expires_in': expires_in, 'detail': 'simulated broker'}
+
+    def logout(self) -> None:
+        self._call()
+
+    def get_option_instrument(self, symbol: str, expiration_date: str, strike: float, call_put: str) -> dict:
+        self._call()
+        return self._instrument(symbol, expiration_date, strike, call_put)
+
+    def _instrument(self, symbol: str, expiration_date: str, strike: float, call_put: str) -> dict:
+        key = (symbol.upper(), expiration_date, round(float(strike), 4), call_put)
+        with self._lock:
+            option_id = self._instrument_ids.get(key)
+            if option_id is None:
+                option_id = str(uuid.uuid5(uuid.NAMESPACE_URL, 'tradebox-simulated:' + ':'.join(map(str, key))))
+                self._instrument_ids[key] = option_id
+                self._instruments[option_id] = {
+                    'id': option_id,
+                    'url': f'https://simulated.tradebox/options/instruments/{option_id}/',
+                    'chain_symbol': key[0],
+                    'expiration_date': expiration_date,
+                    'strike_price': f'{key[2]:.4f}',
+                    'type': call_put,
+                    'state': 'active',
+                    'tradability': 'tradable',
+                    'min_ticks': {'above_tick': '0.05', 'below_tick': '0.01', 'cutoff_price': '3.00'},
+                }
+                self._marks[option_id] = round(self._random.uniform(0.5, 10.0), 2)
+            return dict(self._instruments[option_id])
+
+    def get_option_instrument_by_id(self, option_id: str) -> dict:
+        self._call()
+        with self._lock:
+            instrument_data = self._instruments.get(option_id)
+            return None if instrument_data is None else dict(instrument_data)
+
+    def _quote(self, option_id: str) -> dict:
+        mark = self._marks.get(option_id)
+        if mark is None:
+            return None
+
+        # random walk of up to 1% per quote
+        mark = max(round(mark * (1 + self._random.uniform(-0.01, 0.01)), 2), 0.01)
+        self._marks[option_id] = mark
+        half_spread = max(round(mark * 0.02, 2), 0.01)
+        bid = max(round(mark - half_spread, 2), 0.0)
+        ask = round(mark + half_spread, 2)
+        return {
+            'instrument': self._instruments[option_id]['url'],
+            'instrument_id': option_id,
+            'bid_price': f'{bid:.4f}',
+            'ask_price': f'{ask:.4f}',
+            'mark_price': f'{mark:.4f}',
+            'adjusted_mark_price': f'{mark:.4f}',
+            'bid_size': self._random.randint(1, 200),
+            'ask_size': self._random.randint(1, 200),
+            'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+
+    def get_quote(self, option_id: str) -> dict:
+        self._call()
+        with self._lock:
+            return self._quote(option_id)
+
+    def get_quotes(self, instrument_urls: list) -> list:
+        self._call()
+        with self._lock:
+            return [self._quote(instrument_url.rstrip('/').rsplit('/', 1)[-1]) for instrument_url in instrument_urls]
+
+    def get_open_positions(self) -> list:
+        self._call()
+        with self._lock:
+            self._advance_all()
+            return [dict(position) for position in self._positions.values() if float(position['quantity']) > 0]
+
+    def _place(self, side: str, position_effect: str, price: float, symbol: str, quantity: int,
+               expiration_date: str, strike: float, option_type: str, time_in_force: str) -> dict:
+        self._call()
+        instrument_data = self._instrument(symbol, expiration_date, strike, option_type)
+        with self._lock:
+            self._advance_all()
+            option_id = instrument_data['id']
+            order_id = str(uuid.uuid4())
+            order = {
+                'id': order_id,
+                'state': 'confirmed',
+                'direction': 'debit' if side == 'buy' else 'credit',
+                'price': f'{float(price):.4f}',
+                'premium': f'{float(price) * 100:.4f}',
+                'processed_premium': '0.0000',
+                'quantity': f'{int(quantity):.5f}',
+                'processed_quantity': '0.00000',
+                'pending_quantity': f'{int(quantity):.5f}',
+                'time_in_force': time_in_force,
+                'type': 'limit',
+                'chain_symbol': instrument_data['chain_symbol'],
+                'legs': [{
+                    'option': instrument_data['url'],
+                    'option_id': option_id,
+                    'side': side,
+                    'position_effect': position_effect,
+                    'executions': [],
+                }],
+                'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                '_placed_at': time.monotonic(),
+            }
+
+            held = float(self._positions.get(option_id, {}).get('quantity', 0))
+            if self._random.random() < self.reject_rate:
+                order['state'] = 'rejected'
+            elif side == 'sell' and position_effect == 'close' and quantity > held:
+                order['state'] = 'rejected'
+
+            self._orders[order_id] = order
+            return self._public(order)
+
+    def buy_option_limit(self, position_effect: str, credit_or_debit: str, price: float, symbol: str,
+                         quantity: int, expiration_date: str, strike: float, option_type: str,
+                         time_in_force: str = 'gtc') -> dict:
+        return self._place('buy', position_effect, price, symbol, quantity, expiration_date, strike, option_type, time_in_force)
+
+    def sell_option_limit(self, position_effect: str, credit_or_debit: str, price: float, symbol: str,
+                          quantity: int, expiration_date: str, strike: float, option_type: str,
+                          time_in_force: str = 'gtc') -> dict:
+        return self._place('sell', position_effect, price, symbol, quantity, expiration_date, strike, option_type, time_in_force)
+
+    def _advance_all(self) -> None:
+        for order in self._orders.values():
+            if order['state'] in OPEN_ORDER_STATES:
+                self._advance(order)
+
+    def _advance(self, order: dict) -> None:
+        """Fill an open order if it is due and its price crosses the quote."""
+        if time.monotonic() - order['_placed_at'] < self.fill_delay:
+            return
+
+        leg = order['legs'][0]
+        quote = self._quote(leg['option_id'])
+        price = float(order['price'])
+        if leg['side'] == 'buy' and price < float(quote['ask_price']):
+            return
+        if leg['side'] == 'sell' and price > float(quote['bid_price']):
+            return
+
+        remaining = int(float(order['pending_quantity']))
+        fill_quantity = remaining
+        if remaining > 1 and self._random.random() < self.partial_fill_rate:
+            fill_quantity = self._random.randint(1, remaining - 1)
+
+        leg['executions'].append({
+            'id': str(uuid.uuid4()),
+            'price': order['price'],
+            'quantity': f'{fill_quantity:.5f}',
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        })
+        processed = float(order['processed_quantity']) + fill_quantity
+        order['processed_quantity'] = f'{processed:.5f}'
+        order['pending_quantity'] = f'{remaining - fill_quantity:.5f}'
+        order['processed_premium'] = f'{processed * price * 100:.4f}'
+        order['state'] = 'filled' if fill_quantity == remaining else 'partially_filled'
+        # the rest of a partial fill becomes due after another fill_delay
+        order['_placed_at'] = time.monotonic()
+
+        self._apply_fill(leg, fill_quantity, price, order['chain_symbol'])
+
+    def _apply_fill(self, leg: dict, quantity: int, price: float, chain_symbol: str) -> None:
+        position = self._positions.setdefault(leg['option_id'], {
+            'option_id': leg['option_id'],
+            'option': leg['option'],
+            'chain_symbol': chain_symbol,
+            'quantity': '0.0000',
+            'average_price': '0.0000',
+            'type': 'long',
+        })
+        held = float(position['quantity'])
+        if leg['side'] == 'buy':
+            # Robinhood reports average_price per contract (100 shares)
+            average_price = (held * float(position['average_price']) + quantity * price * 100) / (held + quantity)
+            position['average_price'] = f'{average_price:.4f}'
+            position['quantity'] = f'{held + quantity:.4f}'
+        else:
+            position['quantity'] = f'{max(held - quantity, 0):.4f}'
+
+    def _public(self, order: dict) -> dict:
+        public = {key: value for key, value in order.items() if not key.startswith('_')}
+        public['legs'] = [dict(leg, executions=list(leg['executions'])) for leg in order['legs']]
+        return public
+
+    def get_order(self, order_id: str) -> dict:
+        self._call()
+        with self._lock:
+            order = self._orders.get(order_id)
+            if order is None:
+                return None
+            if order['state'] in OPEN_ORDER_STATES:
+                self._advance(order)
+            return self._public(order)
+
+    def cancel_order(self, order_id: str) -> dict:
+        self._call()
+        with self._lock:
+            order = self._orders.get(order_id)
+            if order is None:
+                return None
+            if order['state'] in OPEN_ORDER_STATES:
+                # an order can fill up to the moment it is cancelled
+                self._advance(order)
+            if order['state'] in OPEN_ORDER_STATES:
+                order['state'] = 'cancelled'
+            return {}
+
+    def cancel_all_orders(self) -> None:
+        self._call()
+        with self._lock:
+            self._advance_all()
+            for order in self._orders.values():
+                if order['state'] in OPEN_ORDER_STATES:
+                    order['state'] = 'cancelled'
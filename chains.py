@@ -0,0 +1,28 @@
+"""Finds the orders released by an executed order.
+
+Orders are linked by execute_only_after_id (the order waits for its
+prerequisite) and execution_deactivates_order_id (executing the order
+deactivates another one). Dependents are looked up through the index
+on execute_only_after_id when an order finishes, so nothing has to be
+kept in sync with the orders table.
+
+When RELEASE_DEPENDENT_ORDERS_ON_COMPLETION is set, jobs.py asks which
+orders an executed order has released and runs them right away, one
+after another, instead of waiting for their own webhooks.
+"""
+
+import db
+import log
+
+
+def release(order_id: int) -> list:
+    """Ids of the orders that order_id's execution allows to run now.
+
+    Returns nothing unless order_id has executed. Orders that are
+    inactive (for example deactivated by this execution) or already
+    executed are left out.
+    """
+    released = db.fetch_released_order_ids(order_id)
+    if released:
+        log.append(f'chains.release(): order #{order_id} released dependent orders {released}.')
+    return released
@@ -13,6 +13,9 @@ TRADEBOX_APP_ADDRESS = 'http://127.0.0.1/'  # must end with '/'
 ROBINHOOD_USERNAME = ''
 ROBINHOOD_PASSWORD = ''
 ROBINHOOD_SESSION_EXPIRES_IN = '172800'  # string (seconds)
+ROBINHOOD_SESSION_REFRESH_MARGIN_SECONDS = 3600  # log in again before use when the session is this close to expiring
+ROBINHOOD_SESSION_REFRESH_LEAD_SECONDS = 7200  # refresh the session in the background this long before it expires
+ROBINHOOD_SESSION_REFRESH_RETRY_SECONDS = 300  # wait before retrying a background refresh
 
 # PUSHOVER NOTIFICATION SETTINGS # Requires a Pushover account for long term use (pushover.net)
 # Available on desktop, Android, iPhone
@@ -20,19 +23,101 @@ ROBINHOOD_SESSION_EXPIRES_IN = '172800'  # string (seconds)
 # To receive notifications, you will need to install the Pushover App on a phone or computer
 PUSHOVER_USER_TOKEN = '' # Pushover User Key (available on main page of pushover.net when logged in)
 PUSHOVER_API_TOKEN = '' # Pushover API Token/Key (under "Your Applications", you need to set up an application for this key)
+PUSHOVER_TIMEOUT_SECONDS = 10.0  # per request
+PUSHOVER_POLL_INTERVAL_SECONDS = 5.0  # how often the outbox is checked for retries
+PUSHOVER_BATCH_SIZE = 20  # notifications sent per outbox check
+PUSHOVER_MAX_ATTEMPTS = 8
+PUSHOVER_RETRY_INITIAL_SECONDS = 2.0  # doubles after each failed attempt
+PUSHOVER_RETRY_MAX_SECONDS = 300.0
 
 # DEBUG ENVIRONMENT SETTINGS
 DEV_IP='127.0.0.1'
 DEV_PORT=5555
 DEV_DEBUG=True
 
+# BROKER
+# 'robinhood' trades through your Robinhood account
+# 'simulated' trades against an in-process simulated market (nothing is sent to Robinhood)
+BROKER = 'robinhood'
+SIMULATED_BROKER_LATENCY_SECONDS = 0.0  # added to every simulated broker call
+SIMULATED_BROKER_FILL_DELAY_SECONDS = 0.0  # time before a marketable order fills
+SIMULATED_BROKER_PARTIAL_FILL_RATE = 0.2  # chance that a fill only covers part of the order
+SIMULATED_BROKER_REJECT_RATE = 0.0  # chance that an order is rejected
+SIMULATED_BROKER_SEED = None  # set an int for repeatable simulated runs
+
+# BROKER RATE LIMITS
+# (requests per second, burst) for each kind of Robinhood call, shared by all server workers and the console
+# remove an entry to leave that kind of call unlimited
+BROKER_RATE_LIMITS = {
+    'auth': (0.2, 2),
+    'orders': (2.0, 5),  # placing orders
+    'order_status': (5.0, 10),
+    'cancel': (5.0, 10),
+    'market_data': (5.0, 10),
+    'instruments': (2.0, 10),
+    'positions': (1.0, 3),
+}
+BROKER_RATE_LIMIT_MAX_RETRIES = 5  # throttled retries before a call fails
+BROKER_RATE_LIMIT_BACKOFF_INITIAL_SECONDS = 1.0  # doubles after each throttled retry, with jitter
+BROKER_RATE_LIMIT_BACKOFF_MAX_SECONDS = 30.0  # used when Robinhood does not say how long to wait
+
+# BACKGROUND EXECUTION
+# number of orders a single server worker can execute at the same time
+JOB_EXECUTOR_MAX_WORKERS = 4
+# run orders whose execute_only_after_id order just executed without waiting for their own request
+RELEASE_DEPENDENT_ORDERS_ON_COMPLETION = False
+# an execution interrupted by a crash or restart has its live orders cancelled at startup;
+# set True to also execute its remaining quantity if it was interrupted recently
+RESUME_INTERRUPTED_EXECUTIONS = False
+RESUME_MAX_AGE_SECONDS = 120
+
+# ORDER FILL DETECTION
+# 'poll' checks each order's state and moves on as soon as it fills
+# 'sleep' waits a fixed 2 seconds for a fill and 3 seconds after cancelling
+ORDER_FILL_DETECTION = 'poll'
+ORDER_FILL_TIMEOUT_SECONDS = 2.0  # longest wait for an order to fill before cancelling
+ORDER_SETTLE_TIMEOUT_SECONDS = 3.0  # longest wait for a cancelled order to settle
+POSITION_SETTLE_TIMEOUT_SECONDS = 3.0  # longest wait for the position to reflect the fills ('poll' only)
+ORDER_POLL_INITIAL_INTERVAL = 0.1  # seconds, doubles after every poll
+ORDER_POLL_MAX_INTERVAL = 0.8  # seconds
+CANCEL_MAX_WORKERS = 8  # orders cancelled at the same time by the end-of-order safety sweep
+
+# POSITION BOOK
+# seconds before cached open positions are fetched again from Robinhood
+POSITION_BOOK_TTL_SECONDS = 5.0
+
+# OPTION INSTRUMENT CACHE
+# number of instrument lookups kept in memory (instruments are also stored in the database)
+INSTRUMENT_CACHE_SIZE = 512
+
+# MARKET DATA
+MARKET_DATA_BATCH_SIZE = 40  # option instruments per market data request
+POSITION_ENRICHMENT_MAX_WORKERS = 8  # threads used to look up position details
+# quotes for active orders and open positions are refreshed in the background and shared by all server workers
+QUOTE_FEED_ENABLED = True
+QUOTE_FEED_INTERVAL_SECONDS = 0.5
+QUOTE_FEED_LEASE_SECONDS = 3.0  # another server worker takes over the feed if it is not renewed for this long
+QUOTE_MAX_AGE_SECONDS = 1.0  # older stored quotes are fetched again before pricing an order
+
+# CONSOLE DASHBOARD ('python console.py --dashboard')
+DASHBOARD_POSITIONS_INTERVAL_SECONDS = 5.0  # how often open positions are reloaded
+DASHBOARD_ORDERS_INTERVAL_SECONDS = 1.0  # how often the database is checked for order changes
+
 # change only if needed (for example, to save database when re-cloning tradebox application)
 # recommended to place these one level below your git cloned directory to preserve database integrity
 # across git clones for future updates
 DATABASE_DIR = '.'
 DATABASE_NAME = 'db.sqlite3'  # change only if needed
+DATABASE_BUSY_TIMEOUT_MS = 5000  # how long to wait for another worker's write lock
+DATABASE_CACHE_SIZE_KB = 8192  # page cache per connection
+DATABASE_STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
 
 # LOGS
 # same advice as database directories
 LOG_PARENT_DIR = '.'
 LOG_DIR_NAME = 'logs'
+LOG_FLUSH_INTERVAL_SECONDS = 0.5  # how often queued log messages are written
+LOG_FSYNC_INTERVAL_SECONDS = 5.0  # how often written log messages are synced to disk
+LOG_BATCH_SIZE = 1000  # most log messages written at once
+LOG_MAX_BYTES = 50000000  # a daily log file larger than this is rotated
+LOG_COMPRESS_ROTATED = True  # gzip rotated log files
@@ -1,9 +1,15 @@
 """Terminal-based script to interact with Tradebox
 Run 'python console.py' from your local or server tradebox directory.
+Run 'python console.py --dashboard' for positions and orders that
+update live in the background while the menu waits for input.
 """
+import sys
+
 import pyinputplus as pyip
 
+import dashboard
 import db
+import recovery
 import tradeapi
 import config
 
@@ -79,6 +85,50 @@ def execute_order():
     tradeapi.execute_order(order_number)
 
 
+def handle_menu_choice(menu_choice: str) -> None:
+    if menu_choice == 'c':
+        create_order()
+    elif menu_choice == 'd':
+        delete_order()
+    elif menu_choice == 'da':
+        delete_all_orders()
+    elif menu_choice == 'car':
+        cancel_all_robinhood_orders()
+    elif menu_choice == 'li':
+        tradeapi.login()
+    elif menu_choice == 'lo':
+        tradeapi.logout()
+    elif menu_choice == 'e':
+        execute_order()
+    elif menu_choice == 'l':
+        print_http_link()
+    elif menu_choice == 'r':
+        recreate_orders_table()
+    elif menu_choice == 'quit' or menu_choice == 'q':
+        quit()
+    elif menu_choice == 'exit':
+        quit()
+    elif menu_choice == '':
+        pass
+    else:
+        print('Invalid selection.')
+
+
+def run_dashboard():
+    live_dashboard = dashboard.Dashboard(menu_options)
+    live_dashboard.start()
+
+    while True:
+        live_dashboard.show()
+        menu_choice = input('> ')
+        live_dashboard.pause()
+
+        print('\n')
+        handle_menu_choice(menu_choice)
+        if menu_choice != '':
+            input('\nPress enter to return to the dashboard.')
+
+
 if __name__ == '__main__':
     # make sure tradebox is logged in
 
@@ -92,6 +142,13 @@ if __name__ == '__main__':
 
     db.create_orders_table()
 
+    recovered_order_ids = recovery.recover_interrupted_executions()
+    if recovered_order_ids:
+        print(f'Recovered interrupted executions of orders {recovered_order_ids}. See the log for details.\n')
+
+    if '--dashboard' in sys.argv[1:] and sys.stdout.isatty():
+        run_dashboard()
+
     while True:
         print('TRADEBOX CONSOLE\n')
 
@@ -114,31 +171,6 @@ if __name__ == '__main__':
 
         print('\n')
 
-        if menu_choice == 'c':
-            create_order()
-        elif menu_choice == 'd':
-            delete_order()
-        elif menu_choice == 'da':
-            delete_all_orders()
-        elif menu_choice == 'car':
-            cancel_all_robinhood_orders()
-        elif menu_choice == 'li':
-            tradeapi.login()
-        elif menu_choice == 'lo':
-            tradeapi.logout()
-        elif menu_choice == 'e':
-            execute_order()
-        elif menu_choice == 'l':
-            print_http_link()
-        elif menu_choice == 'r':
-            recreate_orders_table()
-        elif menu_choice == 'quit' or menu_choice == 'q':
-            quit()
-        elif menu_choice == 'exit':
-            quit()
-        elif menu_choice == '':
-            pass
-        else:
-            print('Invalid selection.')
+        handle_menu_choice(menu_choice)
 
         print('\n\n')
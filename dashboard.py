@@ -0,0 +1,150 @@
+"""Live dashboard for console.py.
+
+Open positions and Tradebox orders are loaded by background threads,
+every DASHBOARD_POSITIONS_INTERVAL_SECONDS and
+DASHBOARD_ORDERS_INTERVAL_SECONDS. Orders are only read again when the
+database has changed. The menu prompt is shown right away. When a
+section's data changes, only the screen rows that differ are rewritten
+(with ANSI cursor movement), so typing at the prompt is not interrupted.
+"""
+
+import datetime
+import shutil
+import sys
+import threading
+
+import config
+import db
+import tradeapi
+
+# ANSI escape sequences
+CLEAR_SCREEN = '\033[H\033[2J'
+CLEAR_LINE = '\033[2K'
+SAVE_CURSOR = '\0337'
+RESTORE_CURSOR = '\0338'
+
+# title, blank line, two section titles, two blank lines, 'Menu:' and the prompt
+FIXED_ROWS = 8
+
+
+class Section:
+    def __init__(self, title: str, load, interval: float) -> None:
+        self.title = title
+        self.load = load
+        self.interval = interval
+        self.lines = ['loading...']
+        self.updated_at = None
+        self.wake = threading.Event()
+
+
+class OrderRows:
+    """Loads the orders table as text, only querying after the database changed."""
+
+    def __init__(self) -> None:
+        self._data_version = None
+
+    def __call__(self) -> list:
+        # data_version only reflects commits by other connections,
+        # so this thread's own connection must be used every time
+        version = db.data_version(db.connection())
+        if version == self._data_version:
+            return None
+        lines = db.get_console_formatted_orders_dataframe().to_string().splitlines()
+        self._data_version = version
+        return lines
+
+
+def position_rows() -> list:
+    return tradeapi.get_console_open_robinhood_positions().to_string().splitlines()
+
+
+class Dashboard:
+    def __init__(self, menu_options: list) -> None:
+        self.menu_options = menu_options
+        self.sections = [
+            Section('OPEN POSITIONS', position_rows, config.DASHBOARD_POSITIONS_INTERVAL_SECONDS),
+            Section('TRADEBOX ORDERS', OrderRows(), config.DASHBOARD_ORDERS_INTERVAL_SECONDS),
+        ]
+        # guards the terminal and the rows currently on screen
+        self._lock = threading.Lock()
+        self._drawn = []
+        self._live = False
+        self._section_rows = 1
+        self._width = 80
+
+    def start(self) -> None:
+        for section in self.sections:
+            refresher = threading.Thread(
+                target=self._refresh_loop, args=(section,), name=f'tradebox-dashboard-{section.title.lower()}', daemon=True
+            )
+            refresher.start()
+
+    def show(self) -> None:
+        """Clear the screen, draw the whole dashboard and keep it updated until pause()."""
+        with self._lock:
+            size = shutil.get_terminal_size()
+            self._width = size.columns
+            self._section_rows = max((size.lines - FIXED_ROWS - len(self.menu_options)) // len(self.sections), 1)
+
+            self._drawn = self._frame()
+            sys.stdout.write(CLEAR_SCREEN + '\n'.join(self._drawn) + '\n')
+            sys.stdout.flush()
+            self._live = True
+
+        # reload orders and positions changed by the last menu action
+        for section in self.sections:
+            section.wake.set()
+
+    def pause(self) -> None:
+        """Stop drawing so menu actions can use the terminal."""
+        with self._lock:
+            self._live = False
+
+    def _refresh_loop(self, section: Section) -> None:
+        while True:
+            section.wake.clear()
+            try:
+                lines = section.load()
+            except Exception as e:
+                lines = [f'Could not load {section.title.lower()}: {e!r}']
+
+            if lines is not None:
+                section.lines = lines
+            section.updated_at = datetime.datetime.now()
+            self._draw_changes()
+
+            section.wake.wait(timeout=section.interval)
+
+    def _frame(self) -> list:
+        frame = ['TRADEBOX CONSOLE (live)', '']
+        for section in self.sections:
+            updated = 'loading' if section.updated_at is None else f'updated {section.updated_at:%H:%M:%S}'
+            frame.append(f'{section.title}  ({updated})')
+
+            lines = section.lines
+            if len(lines) > self._section_rows:
+                hidden = len(lines) - self._section_rows + 1
+                lines = lines[:self._section_rows - 1] + [f'... {hidden} more rows']
+            frame.extend(lines + [''] * (self._section_rows - len(lines)))
+            frame.append('')
+
+        frame.append('Menu:')
+        frame.extend(self.menu_options)
+        # rows wider than the terminal would wrap and move every row below them
+        return [line[:self._width - 1] for line in frame]
+
+    def _draw_changes(self) -> None:
+        with self._lock:
+            if self._live is False:
+                return
+
+            frame = self._frame()
+            changed = [
+                f'\033[{row + 1};1H{CLEAR_LINE}{line}'
+                for row, line in enumerate(frame)
+                if row >= len(self._drawn) or line != self._drawn[row]
+            ]
+            if changed:
+                sys.stdout.write(SAVE_CURSOR + ''.join(changed) + RESTORE_CURSOR)
+                sys.stdout.flush()
+            self._drawn = frame
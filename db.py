@@ -1,42 +1,349 @@
 """Provides functions to interact with local server database."""
 
+import dataclasses
 import datetime
 import os
 import sqlite3
-
-import pandas as pd
+import threading
+import time
 
 import config
+import lazy
 import log
 
+pd = lazy.LazyModule('pandas')
+
 DB_FILEPATH = os.path.join(config.DATABASE_DIR, config.DATABASE_NAME)
 
+# one open connection per thread, reopened after a fork
+_local = threading.local()
+# rate limit buckets use their own connection per thread, so taking a
+# token never commits a transaction open on connection()
+_rate_limit_local = threading.local()
+
+
+@dataclasses.dataclass(slots=True)
+class Order:
+    """A row of the orders table with typed values."""
+    order_id: int
+    active: bool
+    created_at: str
+    executed: bool
+    execute_only_after_id: int
+    execution_deactivates_order_id: int
+    buy_sell: str
+    symbol: str
+    strike: float
+    call_put: str
+    expiration_date: str
+    rh_option_uuid: str
+    market_limit: str
+    limit_price: float
+    quantity: int
+    message_on_success: str
+    message_on_failure: str
+    below_tick: float
+    above_tick: float
+    cutoff_price: float
+    max_order_attempts: int
+    emergency_order_fill_on_failure: bool
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'Order':
+        return cls(
+            order_id=row['order_id'],
+            active=bool(int(row['active'])),
+            created_at=row['created_at'],
+            executed=bool(int(row['executed'])),
+            execute_only_after_id=_optional_int(row['execute_only_after_id']),
+            execution_deactivates_order_id=_optional_int(row['execution_deactivates_order_id']),
+            buy_sell=row['buy_sell'],
+            symbol=row['symbol'],
+            strike=float(row['strike']),
+            call_put=row['call_put'],
+            expiration_date=row['expiration_date'],
+            rh_option_uuid=row['rh_option_uuid'],
+            market_limit=row['market_limit'],
+            limit_price=float(row['limit_price'] or 0.0),
+            quantity=int(row['quantity']),
+            message_on_success=row['message_on_success'],
+            message_on_failure=row['message_on_failure'],
+            below_tick=_optional_float(row['below_tick']),
+            above_tick=_optional_float(row['above_tick']),
+            cutoff_price=_optional_float(row['cutoff_price']),
+            max_order_attempts=int(row['max_order_attempts']),
+            emergency_order_fill_on_failure=bool(int(row['emergency_order_fill_on_failure'])),
+        )
+
+    def to_string(self) -> str:
+        return '\n'.join(
+            f'{field.name:<32}{getattr(self, field.name)}'
+            for field in dataclasses.fields(self)
+        )
+
+
+def _optional_int(value) -> int:
+    # console input leaves optional order ids as empty strings
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _optional_float(value) -> float:
+    # limit orders and older rows may have no tick information
+    if value is None or value == '':
+        return None
+    return float(value)
+
 
 def connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_FILEPATH)
+    return _thread_connection(_local)
+
+
+def _thread_connection(local: threading.local) -> sqlite3.Connection:
+    conn = getattr(local, 'conn', None)
+    if conn is not None and local.pid == os.getpid():
+        return conn
+
+    conn = open_connection()
+    local.conn = conn
+    local.pid = os.getpid()
     return conn
 
 
-def create_orders_table() -> None:
-    conn = connection()
+def open_connection(check_same_thread: bool = True) -> sqlite3.Connection:
+    """Open a new configured connection that is not shared through connection()."""
+    conn = sqlite3.connect(
+        DB_FILEPATH,
+        timeout=config.DATABASE_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=config.DATABASE_STATEMENT_CACHE_SIZE,
+        check_same_thread=check_same_thread,
+    )
+    # WAL lets server workers read while another worker writes
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute(f"PRAGMA busy_timeout={int(config.DATABASE_BUSY_TIMEOUT_MS)};")
+    conn.execute(f"PRAGMA cache_size=-{int(config.DATABASE_CACHE_SIZE_KB)};")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    return conn
+
+
+def close_connection() -> None:
+    for local in (_local, _rate_limit_local):
+        conn = getattr(local, 'conn', None)
+        if conn is not None and local.pid == os.getpid():
+            conn.close()
+        local.conn = None
+
+
+ORDERS_COLUMNS = (
+    'order_id, active, created_at, executed, execute_only_after_id, execution_deactivates_order_id, '
+    'buy_sell, symbol, strike, call_put, expiration_date, rh_option_uuid, market_limit, limit_price, '
+    'quantity, message_on_success, message_on_failure, below_tick, above_tick, cutoff_price, '
+    'max_order_attempts, emergency_order_fill_on_failure'
+)
+
+
+def _migrate_to_v1(conn: sqlite3.Connection) -> None:
+    # the original, untyped orders table
     conn.execute(
         "CREATE TABLE IF NOT EXISTS orders (order_id INTEGER PRIMARY KEY ASC, active INTEGER, created_at TEXT, executed INTEGER DEFAULT 0, execute_only_after_id INTEGER, execution_deactivates_order_id INTEGER, buy_sell TEXT, symbol TEXT, strike REAL, call_put TEXT, expiration_date TEXT, rh_option_uuid TEXT, market_limit TEXT, limit_price REAL, quantity INTEGER, message_on_success TEXT, message_on_failure TEXT, below_tick REAL, above_tick REAL, cutoff_price REAL, max_order_attempts INTEGER, emergency_order_fill_on_failure INTEGER);"
     )
-    conn.commit()
-    conn.close()
+
+
+def _migrate_to_v2(conn: sqlite3.Connection) -> None:
+    # typed columns with CHECK constraints, and indexes for the lookups
+    # done on every execution. SQLite cannot add constraints to an
+    # existing table, so the table is rebuilt.
+    conn.execute(
+        "CREATE TABLE orders_v2 ("
+        "order_id INTEGER PRIMARY KEY ASC, "
+        "active INTEGER NOT NULL DEFAULT 1 CHECK (active IN (0, 1)), "
+        "created_at TEXT CHECK (created_at IS NULL OR datetime(created_at) IS NOT NULL), "
+        "executed INTEGER NOT NULL DEFAULT 0 CHECK (executed IN (0, 1)), "
+        "execute_only_after_id INTEGER CHECK (execute_only_after_id IS NULL OR typeof(execute_only_after_id) = 'integer'), "
+        "execution_deactivates_order_id INTEGER CHECK (execution_deactivates_order_id IS NULL OR typeof(execution_deactivates_order_id) = 'integer'), "
+        "buy_sell TEXT CHECK (buy_sell IN ('buy', 'sell')), "
+        "symbol TEXT, "
+        "strike REAL CHECK (strike > 0), "
+        "call_put TEXT CHECK (call_put IN ('call', 'put')), "
+        "expiration_date TEXT CHECK (expiration_date IS NULL OR date(expiration_date) IS NOT NULL), "
+        "rh_option_uuid TEXT, "
+        "market_limit TEXT CHECK (market_limit IN ('market', 'limit')), "
+        "limit_price REAL CHECK (limit_price >= 0), "
+        "quantity INTEGER CHECK (quantity > 0), "
+        "message_on_success TEXT, "
+        "message_on_failure TEXT, "
+        "below_tick REAL CHECK (below_tick > 0), "
+        "above_tick REAL CHECK (above_tick > 0), "
+        "cutoff_price REAL CHECK (cutoff_price >= 0), "
+        "max_order_attempts INTEGER CHECK (max_order_attempts > 0), "
+        "emergency_order_fill_on_failure INTEGER NOT NULL DEFAULT 0 CHECK (emergency_order_fill_on_failure IN (0, 1)));"
+    )
+    # rows that would fail the new constraints (for example quantity 0,
+    # which the console accepted) are moved aside instead of aborting
+    # the migration
+    invalid_rows = (
+        "LOWER(buy_sell) NOT IN ('buy', 'sell') OR LOWER(call_put) NOT IN ('call', 'put') "
+        "OR LOWER(market_limit) NOT IN ('market', 'limit') OR strike <= 0 "
+        "OR (expiration_date IS NOT NULL AND date(expiration_date) IS NULL) "
+        "OR COALESCE(limit_price, 0) < 0 OR quantity <= 0 OR below_tick <= 0 OR above_tick <= 0 "
+        "OR cutoff_price < 0 OR max_order_attempts <= 0"
+    )
+    invalid_order_ids = [row[0] for row in conn.execute(f"SELECT order_id FROM orders WHERE {invalid_rows};")]
+    if invalid_order_ids:
+        conn.execute("CREATE TABLE IF NOT EXISTS orders_quarantine AS SELECT * FROM orders WHERE 0;")
+        conn.execute(f"INSERT INTO orders_quarantine SELECT * FROM orders WHERE {invalid_rows};")
+        conn.execute(f"DELETE FROM orders WHERE {invalid_rows};")
+        msg = f'db._migrate_to_v2(): moved orders {invalid_order_ids} to the orders_quarantine table ' \
+            + 'because they have invalid values.'
+        log.append(msg)
+
+    # older rows store booleans loosely and leave optional order ids as ''
+    conn.execute(
+        f"INSERT INTO orders_v2 ({ORDERS_COLUMNS}) SELECT "
+        "order_id, "
+        "CASE WHEN active IN (1, '1', 'True', 'true') THEN 1 ELSE 0 END, "
+        "CASE WHEN datetime(created_at) IS NULL THEN NULL ELSE created_at END, "
+        "CASE WHEN executed IN (1, '1', 'True', 'true') THEN 1 ELSE 0 END, "
+        "CAST(NULLIF(execute_only_after_id, '') AS INTEGER), "
+        "CAST(NULLIF(execution_deactivates_order_id, '') AS INTEGER), "
+        "LOWER(buy_sell), symbol, strike, LOWER(call_put), expiration_date, rh_option_uuid, LOWER(market_limit), "
+        "COALESCE(limit_price, 0), quantity, message_on_success, message_on_failure, "
+        "below_tick, above_tick, cutoff_price, max_order_attempts, "
+        "CASE WHEN emergency_order_fill_on_failure IN (1, '1', 'True', 'true') THEN 1 ELSE 0 END "
+        "FROM orders;"
+    )
+    conn.execute("DROP TABLE orders;")
+    conn.execute("ALTER TABLE orders_v2 RENAME TO orders;")
+    conn.execute("CREATE INDEX orders_active_executed ON orders (active, executed);")
+    conn.execute("CREATE INDEX orders_execute_only_after_id ON orders (execute_only_after_id);")
+    conn.execute("CREATE INDEX orders_execution_deactivates_order_id ON orders (execution_deactivates_order_id);")
+    conn.execute("CREATE INDEX orders_rh_option_uuid ON orders (rh_option_uuid);")
+    conn.execute("CREATE INDEX orders_expiration_date ON orders (expiration_date);")
+
+
+def _migrate_to_v3(conn: sqlite3.Connection) -> None:
+    # execution journal: one row per claimed order and one per broker order it places
+    conn.execute(
+        "CREATE TABLE executions (order_id INTEGER PRIMARY KEY, pid INTEGER, status TEXT, buy_sell TEXT, opening_position_size INTEGER, goal_final_position_size INTEGER, started_at TEXT, updated_at REAL);"
+    )
+    conn.execute(
+        "CREATE TABLE execution_attempts (attempt_id INTEGER PRIMARY KEY ASC, order_id INTEGER, kind TEXT, attempt INTEGER, rh_order_id TEXT, price REAL, quantity INTEGER, state TEXT, filled_quantity INTEGER DEFAULT 0, created_at TEXT, updated_at TEXT);"
+    )
+    conn.execute("CREATE INDEX execution_attempts_order_id ON execution_attempts (order_id);")
+    conn.execute("CREATE INDEX executions_running ON executions (status) WHERE status = 'running';")
+
+
+def _migrate_to_v4(conn: sqlite3.Connection) -> None:
+    # background order execution jobs. Tables in versions 4 to 8 were
+    # created outside of migrations before, so they may already exist.
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, order_id INTEGER, status TEXT, phase TEXT, attempts INTEGER DEFAULT 0, filled_quantity INTEGER DEFAULT 0, detail TEXT, created_at TEXT, updated_at TEXT);"
+    )
+
+
+def _migrate_to_v5(conn: sqlite3.Connection) -> None:
+    # option instrument cache
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS option_instruments (option_id TEXT PRIMARY KEY, symbol TEXT, expiration_date TEXT, strike REAL, call_put TEXT, data TEXT, fetched_at TEXT);"
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS option_instruments_contract ON option_instruments (symbol, expiration_date, strike, call_put);"
+    )
+
+
+def _migrate_to_v6(conn: sqlite3.Connection) -> None:
+    # Pushover notification outbox
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS notifications (notification_id INTEGER PRIMARY KEY ASC, message TEXT, created_at TEXT, attempts INTEGER DEFAULT 0, next_attempt_at REAL, claimed_until REAL, sent_at TEXT, last_error TEXT);"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS notifications_pending ON notifications (next_attempt_at) WHERE sent_at IS NULL;"
+    )
+
+
+def _migrate_to_v7(conn: sqlite3.Connection) -> None:
+    # token buckets shared by all processes calling the broker
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS broker_rate_limits (endpoint TEXT PRIMARY KEY, tokens REAL, updated_at REAL, blocked_until REAL DEFAULT 0);"
+    )
+
+
+def _migrate_to_v8(conn: sqlite3.Connection) -> None:
+    # quotes kept fresh by the quote feed, and leases that let one process run a background task
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS option_quotes (option_id TEXT PRIMARY KEY, data TEXT, fetched_at REAL);"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, pid INTEGER, expires_at REAL);"
+    )
+
+
+# MIGRATIONS[n] upgrades the schema from version n to version n + 1
+MIGRATIONS = (
+    _migrate_to_v1,
+    _migrate_to_v2,
+    _migrate_to_v3,
+    _migrate_to_v4,
+    _migrate_to_v5,
+    _migrate_to_v6,
+    _migrate_to_v7,
+    _migrate_to_v8,
+)
+
+
+def schema_version(conn: sqlite3.Connection = None) -> int:
+    conn = conn or connection()
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL);")
+    row = conn.execute("SELECT version FROM schema_version;").fetchone()
+    return 0 if row is None else row[0]
+
+
+def migrate() -> None:
+    """Upgrade the database schema to the latest version in place."""
+    # a short-lived connection, so the migration does not commit a
+    # transaction open on connection() or tie up the rate limit connection
+    conn = open_connection()
+
+    # the write lock keeps server workers from migrating at the same time
+    conn.execute("BEGIN IMMEDIATE;")
+    version = None
+    try:
+        version = schema_version(conn)
+        for target_version in range(version + 1, len(MIGRATIONS) + 1):
+            MIGRATIONS[target_version - 1](conn)
+            log.append(f'db.migrate(): migrated database schema from version {target_version - 1} to {target_version}.')
+
+        if version != len(MIGRATIONS):
+            conn.execute("DELETE FROM schema_version;")
+            conn.execute("INSERT INTO schema_version (version) VALUES (?);", (len(MIGRATIONS),))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        log.append(f'db.migrate(): migration failed, database schema left at version {version}: {e!r}')
+        raise
+    finally:
+        conn.close()
+
+
+def create_orders_table() -> None:
+    migrate()
 
 
 def drop_orders_table() -> None:
     conn = connection()
-    
-    try:
-        conn.execute("DROP TABLE orders;")
-    except sqlite3.OperationalError:
-        msg = "db.drop_orders_table(): Could not drop orders table. Probably does not exist."
-        log.append(msg)
-    
-    conn.commit()
-    conn.close()
+
+    with conn:
+        try:
+            conn.execute("DROP TABLE orders;")
+        except sqlite3.OperationalError:
+            msg = "db.drop_orders_table(): Could not drop orders table. Probably does not exist."
+            log.append(msg)
+        # the next create_orders_table() rebuilds the schema from the first migration
+        conn.execute("DROP TABLE IF EXISTS executions;")
+        conn.execute("DROP TABLE IF EXISTS execution_attempts;")
+        conn.execute("DROP TABLE IF EXISTS schema_version;")
 
 
 def insert_order(
@@ -59,43 +366,46 @@ def insert_order(
         below_tick: float,
         above_tick: float,
         cutoff_price: float,
-        ) -> None:
+        ) -> int:
+    """Insert an order and return its order_id."""
     conn = connection()
 
-    created_at = datetime.datetime.now()
+    created_at = datetime.datetime.now().isoformat(sep=' ')
+    execute_only_after_id = _optional_int(execute_only_after_id)
+    execution_deactivates_order_id = _optional_int(execution_deactivates_order_id)
 
-    conn.execute(
-        "INSERT INTO orders(created_at, rh_option_uuid, execute_only_after_id, "
-        "buy_sell, symbol, expiration_date, strike, call_put, quantity, "
-        "market_limit, below_tick, above_tick, cutoff_price, limit_price, "
-        "message_on_success, message_on_failure, max_order_attempts, "
-        "execution_deactivates_order_id, active, emergency_order_fill_on_failure) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
-        (
-            created_at,
-            rh_option_uuid,
-            execute_only_after_id,
-            buy_sell,
-            symbol,
-            expiration_date,
-            strike,
-            call_put,
-            quantity,
-            market_limit,
-            below_tick,
-            above_tick,
-            cutoff_price,
-            limit_price,
-            message_on_success,
-            message_on_failure,
-            max_order_attempts,
-            execution_deactivates_order_id,
-            active,
-            emergency_order_fill_on_failure,
-        ),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO orders(created_at, rh_option_uuid, execute_only_after_id, "
+            "buy_sell, symbol, expiration_date, strike, call_put, quantity, "
+            "market_limit, below_tick, above_tick, cutoff_price, limit_price, "
+            "message_on_success, message_on_failure, max_order_attempts, "
+            "execution_deactivates_order_id, active, emergency_order_fill_on_failure) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+            (
+                created_at,
+                rh_option_uuid,
+                execute_only_after_id,
+                buy_sell,
+                symbol,
+                expiration_date,
+                strike,
+                call_put,
+                quantity,
+                market_limit,
+                below_tick,
+                above_tick,
+                cutoff_price,
+                limit_price,
+                message_on_success,
+                message_on_failure,
+                max_order_attempts,
+                execution_deactivates_order_id,
+                active,
+                emergency_order_fill_on_failure,
+            ),
+        )
+    return cur.lastrowid
 
 
 def delete_order(order_id: int) -> None:
@@ -107,16 +417,14 @@ def delete_order(order_id: int) -> None:
         return False
 
     conn = connection()
-    conn.execute("DELETE FROM orders WHERE order_id = ?;", (order_id,))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("DELETE FROM orders WHERE order_id = ?;", (order_id,))
 
 
 def delete_all_orders() -> None:
     conn = connection()
-    conn.execute("DELETE FROM orders;")
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("DELETE FROM orders;")
 
 
 def fetch_order_sql(order_id: int) -> tuple:
@@ -133,14 +441,13 @@ def fetch_order_sql(order_id: int) -> tuple:
     orders = res.fetchall()
     order = orders[0]
     cur.close()
-    conn.close()
     return order
 
 
 def order_exists(order_id: int) -> bool:
     try:
         order_id = int(order_id)
-    except ValueError:
+    except (TypeError, ValueError):
         msg = f'db.order_exists({order_id}): order # is not an int. ValueError exception. Returning False.'
         log.append(msg)
         return False
@@ -154,23 +461,27 @@ def order_exists(order_id: int) -> bool:
     else:
         exists = False
     cur.close()
-    conn.close()
     return exists
 
 
-def get_order_series(order_id: int) -> pd.Series:
+def get_order(order_id: int) -> Order:
     try:
         order_id = int(order_id)
-    except ValueError:
-        msg = f'db.get_order_series({order_id}): ValueError exception. Returning None.'
+    except (TypeError, ValueError):
+        msg = f'db.get_order({order_id}): order # is not an int. Returning None.'
         log.append(msg)
         return None
 
     conn = connection()
-    order_dataframe = pd.read_sql(f"SELECT * FROM orders WHERE order_id={order_id};", conn)
-    order_series = order_dataframe.loc[0]
-    conn.close()
-    return order_series
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute("SELECT * FROM orders WHERE order_id=?;", (order_id,))
+    row = cur.fetchone()
+    cur.close()
+
+    if row is None:
+        return None
+    return Order.from_row(row)
 
 
 def fetch_all_orders_sql() -> list:
@@ -179,14 +490,12 @@ def fetch_all_orders_sql() -> list:
     cur.execute("SELECT * FROM orders;")
     orders = cur.fetchall()
     cur.close()
-    conn.close()
     return orders
 
 
-def fetch_all_orders_dataframe() -> pd.DataFrame:
+def fetch_all_orders_dataframe() -> 'pd.DataFrame':
     conn = connection()
     orders_dataframe = pd.read_sql("SELECT * FROM orders;", conn)
-    conn.close()
     return orders_dataframe
 
 
@@ -198,24 +507,21 @@ def set_order_executed_status(order_id: int, executed: bool) -> None:
         msg = f'db.set_order_executed_status({order_id, executed}): ValueError exception. Returning False.'
         log.append(msg)
         return False
-    
+
     conn = connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE orders SET executed=? WHERE order_id=?", (executed, order_id))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conn:
+        conn.execute("UPDATE orders SET executed=? WHERE order_id=?", (executed, order_id))
 
 
 def set_order_active_status(order_id: int, active: bool) -> None:
     try:
         order_id = int(order_id)
-    except ValueError:
+    except (TypeError, ValueError):
         msg = f'db.set_order_active_status({order_id}, {active}): order_id {order_id} is not an integer.\n' \
             + 'Exiting db.set_order_active_status(). No active statuses changed.'
         log.append(msg)
         return
-    
+
     try:
         active = bool(int(active))
     except ValueError:
@@ -225,18 +531,15 @@ def set_order_active_status(order_id: int, active: bool) -> None:
         return
 
     conn = connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE orders SET active=? WHERE order_id=?", (active, order_id))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conn:
+        conn.execute("UPDATE orders SET active=? WHERE order_id=?", (active, order_id))
 
 
 def get_order_executed_status(order_id: int) -> bool:
     # Force python int
     try:
         order_id = int(order_id)
-    except ValueError:
+    except (TypeError, ValueError):
         msg = 'db.get_order_executed_status(): ValueError\nProbably checked an empty string.\nReturning execution status as False.'
         log.append(msg)
         return False
@@ -255,18 +558,464 @@ def get_order_executed_status(order_id: int) -> bool:
         executed_status = False
 
     cur.close()
-    conn.close()
 
     return executed_status
 
 
-def get_console_formatted_orders_dataframe() -> pd.DataFrame:
+def claim_order(order_id: int) -> Order:
+    """Mark an order executed and inactive if it may run now, and return it.
+
+    The order must be active, not executed, and its prerequisite order
+    (execute_only_after_id) must have executed or not exist. The order
+    it deactivates (execution_deactivates_order_id) is deactivated in
+    the same transaction. Returns None if the order was not claimed;
+    claim_failure_reason() explains why.
+    """
+    try:
+        order_id = int(order_id)
+    except (TypeError, ValueError):
+        msg = f'db.claim_order({order_id}): order # is not an int. Returning None.'
+        log.append(msg)
+        return None
+
+    conn = connection()
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    with conn:
+        # the update takes the write lock, so only one worker can claim the order
+        cur.execute(
+            "UPDATE orders SET executed=1, active=0 "
+            "WHERE order_id=? AND active=1 AND executed=0 "
+            "AND (execute_only_after_id IS NULL "
+            "OR NOT EXISTS (SELECT 1 FROM orders AS prerequisite WHERE prerequisite.order_id=orders.execute_only_after_id) "
+            "OR EXISTS (SELECT 1 FROM orders AS prerequisite WHERE prerequisite.order_id=orders.execute_only_after_id AND prerequisite.executed=1)) "
+            "RETURNING *;",
+            (order_id,)
+        )
+        row = cur.fetchone()
+        if row is not None:
+            order = Order.from_row(row)
+            if order.execution_deactivates_order_id is not None:
+                cur.execute(
+                    "UPDATE orders SET active=0 WHERE order_id=?;",
+                    (order.execution_deactivates_order_id,)
+                )
+    cur.close()
+
+    if row is None:
+        return None
+    return order
+
+
+def claim_failure_reason(order_id: int) -> str:
+    order = get_order(order_id)
+    if order is None:
+        return f'order #{order_id} does not exist.'
+    if order.executed is True:
+        return f'order #{order_id} has already executed.'
+    if order.active is False:
+        return f'order #{order_id} is not active.'
+
+    prerequisite = get_order(order.execute_only_after_id) if order.execute_only_after_id is not None else None
+    if prerequisite is not None and prerequisite.executed is False:
+        return f'prerequisite order #{prerequisite.order_id} exists but has not executed.'
+    return f'order #{order_id} could not be claimed.'
+
+
+def fetch_released_order_ids(order_id: int) -> list:
+    """Return the active, unexecuted orders waiting on order_id, if order_id has executed."""
+    conn = connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT dependent.order_id FROM orders AS dependent "
+        "JOIN orders AS prerequisite ON prerequisite.order_id = dependent.execute_only_after_id "
+        "WHERE dependent.execute_only_after_id=? AND prerequisite.executed=1 "
+        "AND dependent.active=1 AND dependent.executed=0 "
+        "ORDER BY dependent.order_id;",
+        (order_id,),
+    )
+    rows = cur.fetchall()
+    cur.close()
+    return [row[0] for row in rows]
+
+
+def data_version(conn: sqlite3.Connection) -> int:
+    # changes whenever another connection commits to the database
+    return conn.execute("PRAGMA data_version;").fetchone()[0]
+
+
+JOB_UPDATE_COLUMNS = ('status', 'phase', 'attempts', 'filled_quantity', 'detail')
+
+
+def insert_job(job_id: str, order_id: int) -> None:
+    conn = connection()
+
+    created_at = datetime.datetime.now()
+
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs(job_id, order_id, status, phase, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?);",
+            (job_id, order_id, 'queued', 'queued', created_at, created_at),
+        )
+
+
+def update_job(job_id: str, **fields) -> None:
+    columns = [column for column in fields if column in JOB_UPDATE_COLUMNS]
+    if len(columns) == 0:
+        return
+
+    assignments = ', '.join(f'{column}=?' for column in columns)
+    values = [fields[column] for column in columns]
+
+    conn = connection()
+    with conn:
+        conn.execute(
+            f"UPDATE jobs SET {assignments}, updated_at=? WHERE job_id=?;",
+            (*values, datetime.datetime.now(), job_id),
+        )
+
+
+def fetch_job(job_id: str) -> dict:
+    conn = connection()
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute("SELECT * FROM jobs WHERE job_id=?;", (job_id,))
+    row = cur.fetchone()
+    cur.close()
+
+    if row is None:
+        return None
+    return dict(row)
+
+
+def insert_instrument(
+        option_id: str,
+        symbol: str,
+        expiration_date: str,
+        strike: float,
+        call_put: str,
+        data: str,
+        ) -> None:
+    conn = connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO option_instruments(option_id, symbol, expiration_date, strike, call_put, data, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?);",
+            (option_id, symbol, expiration_date, strike, call_put, data, datetime.datetime.now()),
+        )
+
+
+def fetch_instrument_data_by_id(option_id: str) -> str:
+    conn = connection()
+    cur = conn.cursor()
+    cur.execute("SELECT data FROM option_instruments WHERE option_id=?;", (option_id,))
+    row = cur.fetchone()
+    cur.close()
+
+    if row is None:
+        return None
+    return row[0]
+
+
+def fetch_instrument_data_by_contract(symbol: str, expiration_date: str, strike: float, call_put: str) -> str:
+    conn = connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT data FROM option_instruments WHERE symbol=? AND expiration_date=? AND strike=? AND call_put=?;",
+        (symbol, expiration_date, strike, call_put),
+    )
+    row = cur.fetchone()
+    cur.close()
+
+    if row is None:
+        return None
+    return row[0]
+
+
+def delete_expired_instruments(today: str) -> None:
+    conn = connection()
+    with conn:
+        conn.execute("DELETE FROM option_instruments WHERE expiration_date < ?;", (today,))
+
+
+def insert_notification(message: str) -> None:
+    conn = connection()
+
+    created_at = datetime.datetime.now()
+
+    with conn:
+        conn.execute(
+            "INSERT INTO notifications(message, created_at, next_attempt_at) VALUES (?, ?, ?);",
+            (message, created_at, time.time()),
+        )
+
+
+def claim_notifications(limit: int, lease_seconds: float) -> list:
+    """Lease up to limit due notifications to this sender.
+
+    Returns (notification_id, message, attempts) tuples. A lease keeps
+    other server workers from sending the same notification.
+    """
+    now = time.time()
+    conn = connection()
+    with conn:
+        cur = conn.execute(
+            "UPDATE notifications SET claimed_until=? "
+            "WHERE notification_id IN ("
+            "SELECT notification_id FROM notifications "
+            "WHERE sent_at IS NULL AND next_attempt_at <= ? AND (claimed_until IS NULL OR claimed_until < ?) "
+            "ORDER BY notification_id LIMIT ?) "
+            "RETURNING notification_id, message, attempts;",
+            (now + lease_seconds, now, now, limit),
+        )
+        notifications = cur.fetchall()
+    return sorted(notifications)
+
+
+def set_notification_sent(notification_id: int) -> None:
+    conn = connection()
+    with conn:
+        conn.execute(
+            "UPDATE notifications SET sent_at=?, attempts=attempts+1, claimed_until=NULL WHERE notification_id=?;",
+            (datetime.datetime.now(), notification_id),
+        )
+
+
+def set_notification_failed(notification_id: int, error: str, next_attempt_at: float) -> None:
+    """Record a failed send. A next_attempt_at of None stops retrying."""
+    conn = connection()
+    with conn:
+        conn.execute(
+            "UPDATE notifications SET attempts=attempts+1, last_error=?, next_attempt_at=?, claimed_until=NULL WHERE notification_id=?;",
+            (error, next_attempt_at, notification_id),
+        )
+
+
+def take_rate_limit_token(endpoint: str, rate: float, burst: int) -> float:
+    """Take a token from endpoint's bucket, refilled at rate tokens per second.
+
+    Returns 0.0 when a token was taken, otherwise the seconds to wait
+    before trying again. The bucket is shared by every process using
+    the database. It is updated on a separate connection, so a
+    transaction open on connection() is left alone, but the caller must
+    not be holding the write lock.
+    """
+    conn = _thread_connection(_rate_limit_local)
+
+    # the write lock makes reading and updating the bucket atomic across server workers
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        now = time.time()
+        row = conn.execute(
+            "SELECT tokens, updated_at, blocked_until FROM broker_rate_limits WHERE endpoint=?;",
+            (endpoint,),
+        ).fetchone()
+        if row is None:
+            tokens, blocked_until = float(burst), 0.0
+        else:
+            tokens = min(float(burst), row[0] + max(now - row[1], 0.0) * rate)
+            blocked_until = row[2] or 0.0
+
+        if blocked_until > now:
+            wait = blocked_until - now
+        elif tokens >= 1.0:
+            tokens -= 1.0
+            wait = 0.0
+        else:
+            wait = (1.0 - tokens) / rate
+
+        conn.execute(
+            "INSERT OR REPLACE INTO broker_rate_limits(endpoint, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?);",
+            (endpoint, tokens, now, blocked_until),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return wait
+
+
+def block_rate_limit(endpoint: str, blocked_until: float) -> None:
+    """Stop every process from calling endpoint until blocked_until (unix time)."""
+    conn = _thread_connection(_rate_limit_local)
+    with conn:
+        conn.execute(
+            "INSERT INTO broker_rate_limits(endpoint, tokens, updated_at, blocked_until) VALUES (?, 0, ?, ?) "
+            "ON CONFLICT(endpoint) DO UPDATE SET tokens=0, updated_at=excluded.updated_at, "
+            "blocked_until=MAX(blocked_until, excluded.blocked_until);",
+            (endpoint, time.time(), blocked_until),
+        )
+
+
+def claim_lease(name: str, seconds: float) -> bool:
+    """Take or renew the lease called name for this process. Only one process holds it at a time."""
+    now = time.time()
+    conn = connection()
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO leases(name, pid, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET pid=excluded.pid, expires_at=excluded.expires_at "
+            "WHERE leases.pid=excluded.pid OR leases.expires_at < ?;",
+            (name, os.getpid(), now + seconds, now),
+        )
+    return cur.rowcount == 1
+
+
+def insert_quotes(quotes: dict, fetched_at: float) -> None:
+    """Store market data for several options. quotes maps option ids to JSON strings."""
+    conn = connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO option_quotes(option_id, data, fetched_at) VALUES (?, ?, ?);",
+            [(option_id, data, fetched_at) for option_id, data in quotes.items()],
+        )
+
+
+def fetch_quote(option_id: str) -> tuple:
+    """Return (data, fetched_at) of the stored quote for option_id, or None."""
+    conn = connection()
+    cur = conn.cursor()
+    cur.execute("SELECT data, fetched_at FROM option_quotes WHERE option_id=?;", (option_id,))
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+
+def fetch_watched_option_ids() -> list:
+    """Return the option ids of active orders and of orders being executed."""
+    conn = connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT DISTINCT rh_option_uuid FROM orders "
+        "WHERE rh_option_uuid IS NOT NULL AND ((active=1 AND executed=0) "
+        "OR order_id IN (SELECT order_id FROM executions WHERE status IN ('running', 'recovering')));"
+    )
+    rows = cur.fetchall()
+    cur.close()
+    return [row[0] for row in rows]
+
+
+EXECUTION_UPDATE_COLUMNS = ('status', 'pid', 'opening_position_size', 'goal_final_position_size')
+
+# attempt states that may still have a live order on the broker
+OPEN_ATTEMPT_STATES = ('placed', 'cancel_requested')
+
+
+def start_execution(order_id: int, buy_sell: str) -> None:
+    conn = connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO executions(order_id, pid, status, buy_sell, started_at, updated_at) "
+            "VALUES (?, ?, 'running', ?, ?, ?);",
+            (order_id, os.getpid(), buy_sell, datetime.datetime.now(), time.time()),
+        )
+
+
+def update_execution(order_id: int, **fields) -> None:
+    columns = [column for column in EXECUTION_UPDATE_COLUMNS if column in fields]
+    assignments = ''.join(f'{column}=?, ' for column in columns)
+    values = [fields[column] for column in columns]
+
+    conn = connection()
+    with conn:
+        conn.execute(
+            f"UPDATE executions SET {assignments}updated_at=? WHERE order_id=?;",
+            (*values, time.time(), order_id),
+        )
+
+
+def fetch_execution(order_id: int) -> dict:
+    conn = connection()
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute("SELECT * FROM executions WHERE order_id=?;", (order_id,))
+    row = cur.fetchone()
+    cur.close()
+    return None if row is None else dict(row)
+
+
+def fetch_running_executions() -> list:
+    conn = connection()
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute("SELECT * FROM executions WHERE status='running';")
+    rows = cur.fetchall()
+    cur.close()
+    return [dict(row) for row in rows]
+
+
+def claim_running_execution(order_id: int, pid: int) -> bool:
+    """Take over a running execution left by process pid. Only one process succeeds."""
+    conn = connection()
+    with conn:
+        cur = conn.execute(
+            "UPDATE executions SET status='recovering', pid=?, updated_at=? "
+            "WHERE order_id=? AND status='running' AND pid=?;",
+            (os.getpid(), time.time(), order_id, pid),
+        )
+    return cur.rowcount == 1
+
+
+def insert_execution_attempt(order_id: int, kind: str, attempt: int, rh_order_id: str, price: float, quantity: int) -> int:
+    now = datetime.datetime.now()
+    conn = connection()
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO execution_attempts(order_id, kind, attempt, rh_order_id, price, quantity, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'placed', ?, ?);",
+            (order_id, kind, attempt, rh_order_id, price, quantity, now, now),
+        )
+        conn.execute("UPDATE executions SET updated_at=? WHERE order_id=?;", (time.time(), order_id))
+    return cur.lastrowid
+
+
+def set_execution_attempt_state(attempt_id: int, state: str, filled_quantity: int = None) -> None:
+    conn = connection()
+    with conn:
+        conn.execute(
+            "UPDATE execution_attempts SET state=?, filled_quantity=COALESCE(?, filled_quantity), updated_at=? "
+            "WHERE attempt_id=?;",
+            (state, filled_quantity, datetime.datetime.now(), attempt_id),
+        )
+        conn.execute(
+            "UPDATE executions SET updated_at=? WHERE order_id=(SELECT order_id FROM execution_attempts WHERE attempt_id=?);",
+            (time.time(), attempt_id),
+        )
+
+
+def fetch_open_execution_attempts(order_id: int) -> list:
+    """Return (attempt_id, rh_order_id) of attempts whose broker order may still be live."""
+    conn = connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT attempt_id, rh_order_id FROM execution_attempts "
+        f"WHERE order_id=? AND state IN ({', '.join('?' * len(OPEN_ATTEMPT_STATES))}) ORDER BY attempt_id;",
+        (order_id, *OPEN_ATTEMPT_STATES),
+    )
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def fetch_execution_filled_quantity(order_id: int) -> int:
+    conn = connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT COALESCE(SUM(filled_quantity), 0) FROM execution_attempts WHERE order_id=?;",
+        (order_id,),
+    )
+    filled_quantity = cur.fetchone()[0]
+    cur.close()
+    return filled_quantity
+
+
+def get_console_formatted_orders_dataframe() -> 'pd.DataFrame':
     conn = connection()
     order_dataframe = pd.read_sql(
         "SELECT order_id, active, executed, execute_only_after_id, execution_deactivates_order_id,  buy_sell, symbol, strike, call_put, expiration_date, quantity, emergency_order_fill_on_failure FROM orders;",
         conn,
     )
-    conn.close()
     # minimize column name length for display
     order_dataframe.rename(
         columns={
@@ -0,0 +1,10 @@
+"""gunicorn settings for Tradebox.
+
+gunicorn loads this file from the directory it is started in.
+"""
+
+
+def post_fork(server, worker):
+    # background threads must be started in each worker, not in the master
+    import tradebox
+    tradebox.start_background_services()
@@ -0,0 +1,135 @@
+"""Caches Robinhood option instrument data.
+
+Instrument data (id, strike, type, expiration, min_ticks) never changes
+for a contract, so it is stored in the local database with an in-memory
+LRU in front. Entries are dropped once the contract has expired.
+"""
+
+import collections
+import datetime
+import json
+import threading
+
+import broker
+import config
+import db
+import log
+
+_lru = collections.OrderedDict()
+_lock = threading.Lock()
+_purged = False
+
+
+def _purge_expired_once() -> None:
+    # stored instruments of expired contracts are removed on first use in each process
+    global _purged
+    if _purged is False:
+        db.delete_expired_instruments(_today())
+        _purged = True
+
+
+def _today() -> str:
+    return datetime.date.today().strftime('%Y-%m-%d')
+
+
+def _id_key(option_id: str) -> tuple:
+    return ('id', option_id)
+
+
+def _contract_key(symbol: str, expiration_date: str, strike: float, call_put: str) -> tuple:
+    return ('contract', symbol.upper().strip(), expiration_date, round(float(strike), 4), call_put.lower().strip())
+
+
+def _is_expired(instrument_data: dict) -> bool:
+    return instrument_data['expiration_date'] < _today()
+
+
+def _lru_get(key: tuple) -> dict:
+    with _lock:
+        instrument_data = _lru.get(key)
+        if instrument_data is not None:
+            _lru.move_to_end(key)
+        return instrument_data
+
+
+def _lru_put(instrument_data: dict) -> None:
+    keys = (
+        _id_key(instrument_data['id']),
+        _contract_key(
+            instrument_data['chain_symbol'],
+            instrument_data['expiration_date'],
+            instrument_data['strike_price'],
+            instrument_data['type'],
+        ),
+    )
+    with _lock:
+        for key in keys:
+            _lru[key] = instrument_data
+            _lru.move_to_end(key)
+        while len(_lru) > config.INSTRUMENT_CACHE_SIZE:
+            _lru.popitem(last=False)
+
+
+def _store(instrument_data: dict) -> None:
+    _lru_put(instrument_data)
+    db.insert_instrument(
+        instrument_data['id'],
+        instrument_data['chain_symbol'].upper(),
+        instrument_data['expiration_date'],
+        round(float(instrument_data['strike_price']), 4),
+        instrument_data['type'],
+        json.dumps(instrument_data),
+    )
+
+
+def _from_cache(key: tuple, fetch_row) -> dict:
+    instrument_data = _lru_get(key)
+    if instrument_data is None:
+        _purge_expired_once()
+        row = fetch_row()
+        if row is not None:
+            instrument_data = json.loads(row)
+            _lru_put(instrument_data)
+
+    if instrument_data is not None and _is_expired(instrument_data):
+        return None
+    return instrument_data
+
+
+def get(symbol: str, expiration_date: str, strike: float, call_put: str) -> dict:
+    """Return instrument data for a contract, or None if it does not exist."""
+    key = _contract_key(symbol, expiration_date, strike, call_put)
+    instrument_data = _from_cache(
+        key,
+        lambda: db.fetch_instrument_data_by_contract(key[1], key[2], key[3], key[4]),
+    )
+    if instrument_data is not None:
+        return instrument_data
+
+    instrument_data = broker.get().get_option_instrument(
+        symbol, expiration_date, strike, call_put
+    )
+    if instrument_data is None:
+        return None
+
+    _store(instrument_data)
+    return instrument_data
+
+
+def get_by_id(option_id: str) -> dict:
+    """Return instrument data for a Robinhood option id, or None if unknown."""
+    instrument_data = _from_cache(
+        _id_key(option_id),
+        lambda: db.fetch_instrument_data_by_id(option_id),
+    )
+    if instrument_data is not None:
+        return instrument_data
+
+    instrument_data = broker.get().get_option_instrument_by_id(option_id)
+    if instrument_data is None:
+        msg = f'instruments.get_by_id({option_id}): broker returned no instrument data.'
+        log.append(msg)
+        return None
+
+    _store(instrument_data)
+    return instrument_data
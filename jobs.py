@@ -0,0 +1,188 @@
+"""Runs Tradebox order executions in the background.
+
+Executions are queued on an in-process thread pool so that the Flask
+request returns immediately. Job progress is stored in the local
+database so that any server worker can report on it.
+
+Orders for different option instruments run concurrently. Orders for
+the same instrument (rh_option_uuid) run one at a time so that their
+position tracking does not overlap: an order submitted while another
+order on its instrument is running is queued and run by that order's
+thread afterwards, so it does not hold a pool thread while it waits.
+
+With RELEASE_DEPENDENT_ORDERS_ON_COMPLETION set, orders waiting on an
+order that just executed (execute_only_after_id) run right after it on
+the same job thread.
+"""
+
+import collections
+import concurrent.futures
+import threading
+import traceback
+import uuid
+
+import chains
+import config
+import db
+import log
+
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.JOB_EXECUTOR_MAX_WORKERS,
+    thread_name_prefix='tradebox-job',
+)
+
+# job id of the execution running on the current thread
+_current = threading.local()
+
+# rh_option_uuid -> jobs waiting for the job running on that instrument.
+# An instrument has an entry only while one of its jobs is running, so
+# waiting jobs hold no pool thread and finished instruments are dropped.
+_waiting = {}
+_waiting_lock = threading.Lock()
+
+
+def submit(order_id: int) -> str:
+    job_id, _ = _submit(order_id)
+    return job_id
+
+
+def run_batch(order_ids: list) -> list:
+    """Execute several orders concurrently and wait for all of them.
+
+    Returns the final job record of each order, in the order given.
+    """
+    submitted = [_submit(order_id) for order_id in order_ids]
+    concurrent.futures.wait([future for _, future in submitted])
+    return [get(job_id) for job_id, _ in submitted]
+
+
+def _submit(order_id: int) -> tuple[str, concurrent.futures.Future]:
+    job_id = uuid.uuid4().hex
+    db.insert_job(job_id, order_id)
+
+    msg = f'jobs.submit(): queued order #{order_id} as job {job_id}.'
+    log.append(msg)
+
+    future = concurrent.futures.Future()
+    job = (job_id, order_id, future)
+    rh_option_uuid = _instrument(order_id)
+    if _claim_instrument(rh_option_uuid, job):
+        _executor.submit(_run, rh_option_uuid, job)
+    return job_id, future
+
+
+def _instrument(order_id: int) -> str:
+    order = db.get_order(order_id)
+    return order.rh_option_uuid if order is not None else None
+
+
+def _claim_instrument(rh_option_uuid: str, job: tuple) -> bool:
+    """Mark the instrument busy and return True, or queue job behind its running job and return False.
+
+    Orders without an instrument (unknown orders) are never queued.
+    """
+    if rh_option_uuid is None:
+        return True
+
+    with _waiting_lock:
+        waiting = _waiting.get(rh_option_uuid)
+        if waiting is None:
+            _waiting[rh_option_uuid] = collections.deque()
+            return True
+        waiting.append(job)
+
+    db.update_job(job[0], phase='waiting_for_instrument')
+    return False
+
+
+def _next_waiting(rh_option_uuid: str) -> tuple:
+    """Return the next job waiting for the instrument, or free the instrument if there is none."""
+    if rh_option_uuid is None:
+        return None
+
+    with _waiting_lock:
+        waiting = _waiting[rh_option_uuid]
+        if waiting:
+            return waiting.popleft()
+        del _waiting[rh_option_uuid]
+        return None
+
+
+def _run(rh_option_uuid: str, job: tuple) -> None:
+    # runs on a pool thread holding rh_option_uuid, then runs the jobs
+    # that queued for the instrument meanwhile, one at a time
+    while job is not None:
+        job_id, order_id, future = job
+        try:
+            _run_with_dependents(rh_option_uuid, job_id, order_id)
+        except Exception as ex:
+            tb_lines = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
+            log.append(f'jobs._run(): job {job_id} for order #{order_id} failed.\n' + ''.join(tb_lines))
+        finally:
+            if future is not None:
+                future.set_result(None)
+        job = _next_waiting(rh_option_uuid)
+
+
+def _run_with_dependents(rh_option_uuid: str, job_id: str, order_id: int) -> None:
+    # dependents released by an execution run next on this thread, one
+    # at a time, so that deactivations between siblings take effect
+    # before the next sibling starts. A dependent on an instrument with
+    # a running job waits for that job instead.
+    completed = _run_one(job_id, order_id)
+    if completed is False or config.RELEASE_DEPENDENT_ORDERS_ON_COMPLETION is False:
+        return
+
+    for dependent_id in chains.release(order_id):
+        dependent_job_id = uuid.uuid4().hex
+        db.insert_job(dependent_job_id, dependent_id)
+        log.append(f'jobs._run(): order #{order_id} released order #{dependent_id} as job {dependent_job_id}.')
+
+        dependent_job = (dependent_job_id, dependent_id, None)
+        dependent_uuid = _instrument(dependent_id)
+        if dependent_uuid is None or dependent_uuid == rh_option_uuid:
+            _run_with_dependents(rh_option_uuid, dependent_job_id, dependent_id)
+        elif _claim_instrument(dependent_uuid, dependent_job):
+            try:
+                _run_with_dependents(dependent_uuid, dependent_job_id, dependent_id)
+            finally:
+                # jobs that queued for the dependent's instrument meanwhile
+                next_job = _next_waiting(dependent_uuid)
+                if next_job is not None:
+                    _executor.submit(_run, dependent_uuid, next_job)
+
+
+def _run_one(job_id: str, order_id: int) -> bool:
+    # imported here so tradeapi can report progress through this module
+    import tradeapi
+
+    _current.job_id = job_id
+
+    try:
+        db.update_job(job_id, status='running', phase='starting')
+        tradeapi.execute_order(order_id)
+        db.update_job(job_id, status='completed')
+        return True
+    except Exception as ex:
+        tb_lines = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
+        log.append(f'jobs._run(): job {job_id} for order #{order_id} failed.\n' + ''.join(tb_lines))
+        db.update_job(job_id, status='failed', detail=repr(ex))
+        return False
+    finally:
+        _current.job_id = None
+
+
+def report(**fields) -> None:
+    """Record progress for the job running on this thread, if any."""
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is None:
+        return
+
+    try:
+        db.update_job(job_id, **fields)
+    except Exception as e:
+        log.append(f'jobs.report(): could not update job {job_id}: {e}')
+
+
+def get(job_id: str) -> dict:
+    return db.fetch_job(job_id)
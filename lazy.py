@@ -0,0 +1,30 @@
+"""Defers importing heavy modules until they are first used.
+
+pandas and robin_stocks take hundreds of milliseconds to import.
+Wrapping them in LazyModule keeps server worker and console start up
+fast on code paths that never touch them.
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<LazyModule {self._name} ({state})>'
@@ -1,7 +1,23 @@
-"""Provides server-side logging for Tradebox."""
+"""Provides server-side logging for Tradebox.
 
+append() only puts the message on a queue. A background writer thread
+batches queued messages into the daily log file, fsyncs on a schedule,
+and rotates files by date and size. Call flush() to wait for everything
+queued so far to reach disk.
+
+append_json() writes structured records to a separate daily JSON lines
+file (for example trace-YYYY-MM-DD.jsonl) through the same writer.
+"""
+
+import atexit
 import datetime
+import gzip
+import json
 import os
+import queue
+import shutil
+import threading
+import time
 
 import config
 
@@ -11,13 +27,191 @@ try:
 except FileExistsError:
     pass
 
+_STOP = object()
+
+_queue = queue.SimpleQueue()
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
 
 def append(message: str) -> None:
-    log_filename = f'log-{datetime.datetime.now().strftime("%Y-%m-%d")}.txt'
-    log_file_path = os.path.join(LOG_DIR, log_filename)
-
-    with open(log_file_path, mode='a', encoding='utf-8') as log_file:
-        log_file.write(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'))
-        log_file.write('\n')
-        log_file.write(message)
-        log_file.write('\n\n')
+    _ensure_writer()
+    _queue.put((time.time(), 'log', message))
+
+
+def append_json(file_prefix: str, record: dict) -> None:
+    """Queue record to be written as one line of {file_prefix}-YYYY-MM-DD.jsonl."""
+    _ensure_writer()
+    _queue.put((time.time(), file_prefix, record))
+
+
+def flush(timeout: float = 10.0) -> bool:
+    """Block until queued messages are written and synced to disk."""
+    _ensure_writer()
+    flushed = threading.Event()
+    _queue.put(flushed)
+    return flushed.wait(timeout)
+
+
+def _ensure_writer() -> None:
+    global _queue, _writer, _writer_pid
+
+    if _writer_pid == os.getpid():
+        return
+
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        # a forked server worker starts with its own queue and writer
+        if _writer_pid is not None:
+            _queue = queue.SimpleQueue()
+        _writer = threading.Thread(target=_write_loop, args=(_queue,), name='tradebox-log-writer', daemon=True)
+        _writer.start()
+        _writer_pid = os.getpid()
+
+
+def _shutdown() -> None:
+    if _writer_pid != os.getpid() or _writer is None:
+        return
+    _queue.put(_STOP)
+    _writer.join(timeout=10.0)
+
+
+atexit.register(_shutdown)
+
+
+def _log_file_path(file_prefix: str, date_string: str) -> str:
+    extension = '.txt' if file_prefix == 'log' else '.jsonl'
+    return os.path.join(LOG_DIR, f'{file_prefix}-{date_string}{extension}')
+
+
+def _format(file_prefix: str, record_time: datetime.datetime, payload) -> str:
+    if file_prefix == 'log':
+        return f'{record_time.strftime("%Y-%m-%d %H:%M:%S.%f")}\n{payload}\n\n'
+    return json.dumps({'time': record_time.isoformat(), **payload}, default=str) + '\n'
+
+
+def _write_loop(record_queue: queue.SimpleQueue) -> None:
+    # file prefix -> (open file, date string of the open file)
+    open_files = {}
+    last_sync = time.monotonic()
+
+    while True:
+        try:
+            item = record_queue.get(timeout=config.LOG_FLUSH_INTERVAL_SECONDS)
+        except queue.Empty:
+            item = None
+
+        items = [] if item is None else [item]
+        while len(items) < config.LOG_BATCH_SIZE:
+            try:
+                items.append(record_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        flush_events = []
+        stop = False
+        lines_by_file = {}
+        for item in items:
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                flush_events.append(item)
+            else:
+                timestamp, file_prefix, payload = item
+                record_time = datetime.datetime.fromtimestamp(timestamp)
+                date_string = record_time.strftime('%Y-%m-%d')
+                try:
+                    line = _format(file_prefix, record_time, payload)
+                except (TypeError, ValueError) as e:
+                    line = _format('log', record_time, f'log: could not format {file_prefix} record: {e}')
+                    file_prefix = 'log'
+                lines_by_file.setdefault((file_prefix, date_string), []).append(line)
+
+        sync = flush_events or stop or time.monotonic() - last_sync >= config.LOG_FSYNC_INTERVAL_SECONDS
+
+        for (file_prefix, date_string), lines in lines_by_file.items():
+            log_file, log_file_date = open_files.pop(file_prefix, (None, None))
+            try:
+                if log_file is not None and log_file_date != date_string:
+                    log_file.close()
+                    log_file = None
+                    _compress(_log_file_path(file_prefix, log_file_date))
+                log_file = _reopen_if_rotated(log_file, _log_file_path(file_prefix, date_string))
+
+                # one write per batch keeps batches from different workers whole
+                log_file.write(''.join(lines))
+                log_file.flush()
+
+                if log_file.tell() >= config.LOG_MAX_BYTES:
+                    log_file.close()
+                    log_file = None
+                    _rotate_by_size(_log_file_path(file_prefix, date_string))
+            except OSError:
+                # a failed write must not kill the writer thread
+                if log_file is not None:
+                    log_file.close()
+                    log_file = None
+
+            if log_file is not None:
+                open_files[file_prefix] = (log_file, date_string)
+
+        if sync:
+            for log_file, _ in open_files.values():
+                try:
+                    os.fsync(log_file.fileno())
+                except OSError:
+                    pass
+            last_sync = time.monotonic()
+
+        for flush_event in flush_events:
+            flush_event.set()
+
+        if stop:
+            for log_file, _ in open_files.values():
+                log_file.close()
+            return
+
+
+def _reopen_if_rotated(log_file, log_file_path: str):
+    # another server worker may have rotated the file we have open
+    if log_file is not None:
+        try:
+            if os.stat(log_file_path).st_ino == os.fstat(log_file.fileno()).st_ino:
+                return log_file
+        except FileNotFoundError:
+            pass
+        log_file.close()
+
+    return open(log_file_path, mode='a', encoding='utf-8')
+
+
+def _rotate_by_size(log_file_path: str) -> None:
+    base, extension = os.path.splitext(log_file_path)
+    index = 1
+    while os.path.exists(f'{base}.{index}{extension}') or os.path.exists(f'{base}.{index}{extension}.gz'):
+        index += 1
+
+    rotated_path = f'{base}.{index}{extension}'
+    try:
+        os.rename(log_file_path, rotated_path)
+    except FileNotFoundError:
+        return  # already rotated by another worker
+    _compress(rotated_path)
+
+
+def _compress(log_file_path: str) -> None:
+    if config.LOG_COMPRESS_ROTATED is False:
+        return
+
+    # renaming first makes sure only one server worker compresses a file
+    claimed_path = f'{log_file_path}.{os.getpid()}.compressing'
+    try:
+        os.rename(log_file_path, claimed_path)
+    except FileNotFoundError:
+        return
+
+    with open(claimed_path, 'rb') as source, gzip.open(f'{log_file_path}.gz', 'wb') as target:
+        shutil.copyfileobj(source, target)
+    os.remove(claimed_path)
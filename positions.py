@@ -0,0 +1,75 @@
+"""Keeps an indexed copy of open Robinhood option positions.
+
+The position book is shared by the order executors and the console.
+It refreshes when its data is older than POSITION_BOOK_TTL_SECONDS
+or when a caller asks for a refresh after an order event. A failed
+fetch raises PositionFetchError and leaves the previous data in place,
+so a failed request is never mistaken for an account without positions.
+"""
+
+import threading
+import time
+
+import broker
+import config
+import log
+
+
+class PositionFetchError(Exception):
+    """Robinhood did not return the open positions."""
+
+
+class PositionBook:
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._positions = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        open_positions = broker.get().get_open_positions()
+
+        # robin_stocks returns None or [None] when the request fails
+        if open_positions is None or None in open_positions:
+            log.append('positions.PositionBook.refresh(): broker returned no position data. Keeping the previous positions.')
+            raise PositionFetchError('Could not fetch open option positions.')
+
+        positions = {}
+        for open_pos in open_positions:
+            positions[open_pos['option_id']] = open_pos
+
+        with self._lock:
+            self._positions = positions
+            self._fetched_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._fetched_at = None
+
+    def _ensure_fresh(self, refresh: bool) -> None:
+        fetched_at = self._fetched_at
+        if refresh or fetched_at is None or time.monotonic() - fetched_at > self.ttl:
+            self.refresh()
+
+    def get(self, option_id: str, refresh: bool = False) -> dict:
+        """Return the open position for option_id, or None if not held."""
+        self._ensure_fresh(refresh)
+        return self._positions.get(option_id)
+
+    def quantity(self, option_id: str, refresh: bool = False) -> int:
+        """Return the held quantity for option_id, or None if not held."""
+        open_pos = self.get(option_id, refresh)
+        if open_pos is None:
+            return None
+        return int(float(open_pos['quantity']))
+
+    def all(self, refresh: bool = False) -> list:
+        self._ensure_fresh(refresh)
+        return list(self._positions.values())
+
+    def cached(self) -> list:
+        """Return the positions from the last refresh without fetching them."""
+        return list(self._positions.values())
+
+
+book = PositionBook(config.POSITION_BOOK_TTL_SECONDS)
@@ -1,13 +1,126 @@
-import http.client, urllib
+"""Sends Pushover notifications through a durable outbox.
+
+send_notification() stores the message in the notifications table and
+returns right away. A background sender drains the table over one
+keep-alive HTTPS connection and retries failed sends with backoff, so a
+slow or unreachable Pushover API does not delay order execution.
+"""
+
+import http.client
+import os
+import threading
+import time
+import urllib.parse
 
 import config
+import db
+import log
+
+PUSHOVER_HOST = 'api.pushover.net'
+
+_wake = threading.Event()
+_sender_pid = None
+_sender_lock = threading.Lock()
+_connection = None
+
 
 def send_notification(msg):
-    conn = http.client.HTTPSConnection("api.pushover.net:443")
-    conn.request("POST", "/1/messages.json",
-    urllib.parse.urlencode({
-        "token": config.PUSHOVER_API_TOKEN, # Pushover API Token/Key (under "Your Applications")
-        "user": config.PUSHOVER_USER_TOKEN, # Pushover User Key (available on main page on pushover.net)
-        "message": msg,
-    }), { "Content-type": "application/x-www-form-urlencoded" })
-    res = conn.getresponse()
\ No newline at end of file
+    start_sender()
+    db.insert_notification(msg)
+    _wake.set()
+
+
+def start_sender() -> None:
+    global _sender_pid
+
+    if _sender_pid == os.getpid():
+        return
+
+    with _sender_lock:
+        if _sender_pid == os.getpid():
+            return
+        sender = threading.Thread(target=_send_loop, name='tradebox-pushover', daemon=True)
+        sender.start()
+        _sender_pid = os.getpid()
+
+
+def _send_loop() -> None:
+    while True:
+        _wake.wait(timeout=config.PUSHOVER_POLL_INTERVAL_SECONDS)
+        _wake.clear()
+
+        try:
+            notifications = db.claim_notifications(
+                config.PUSHOVER_BATCH_SIZE,
+                config.PUSHOVER_TIMEOUT_SECONDS * config.PUSHOVER_BATCH_SIZE * 2,
+            )
+        except Exception as e:
+            log.append(f'pushover._send_loop(): Could not read notification outbox: {e!r}')
+            continue
+
+        for notification_id, message, attempts in notifications:
+            _send(notification_id, message, attempts)
+
+        # there may be more due notifications than one batch
+        if len(notifications) == config.PUSHOVER_BATCH_SIZE:
+            _wake.set()
+
+
+def _send(notification_id: int, message: str, attempts: int) -> None:
+    try:
+        status, body = _post(message)
+    except (OSError, http.client.HTTPException) as e:
+        _close_connection()
+        status, body = None, repr(e)
+
+    if status == 200:
+        db.set_notification_sent(notification_id)
+        return
+
+    attempts += 1
+    # 4xx other than rate limiting means the request itself is bad (for example an invalid token)
+    retryable = status is None or status == 429 or status >= 500
+    if retryable and attempts < config.PUSHOVER_MAX_ATTEMPTS:
+        backoff = min(
+            config.PUSHOVER_RETRY_INITIAL_SECONDS * 2 ** (attempts - 1),
+            config.PUSHOVER_RETRY_MAX_SECONDS,
+        )
+        next_attempt_at = time.time() + backoff
+    else:
+        next_attempt_at = None
+        msg = f'pushover._send(): Giving up on notification #{notification_id} after {attempts} attempts.\n' \
+            + f'Last response: {status} {body}\nMessage: {message}'
+        log.append(msg)
+
+    db.set_notification_failed(notification_id, f'{status} {body}', next_attempt_at)
+
+
+def _post(message: str) -> tuple[int, str]:
+    global _connection
+
+    if _connection is None:
+        _connection = http.client.HTTPSConnection(
+            PUSHOVER_HOST, 443, timeout=config.PUSHOVER_TIMEOUT_SECONDS
+        )
+
+    _connection.request("POST", "/1/messages.json",
+        urllib.parse.urlencode({
+            "token": config.PUSHOVER_API_TOKEN, # Pushover API Token/Key (under "Your Applications")
+            "user": config.PUSHOVER_USER_TOKEN, # Pushover User Key (available on main page on pushover.net)
+            "message": message,
+        }), { "Content-type": "application/x-www-form-urlencoded" })
+    res = _connection.getresponse()
+    # the response must be read completely before the connection can be reused
+    body = res.read().decode('utf-8', errors='replace')
+
+    if res.will_close:
+        _close_connection()
+
+    return res.status, body
+
+
+def _close_connection() -> None:
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
@@ -0,0 +1,144 @@
+"""Keeps fresh market data for the options Tradebox is trading.
+
+A background feed refreshes quotes for the options of active orders,
+orders being executed and the open positions last fetched by the
+position book every QUOTE_FEED_INTERVAL_SECONDS, in batched market
+data requests, and stores them in the option_quotes table. One server worker at a time
+runs the feed, holding a lease in the database; the others take over
+if it stops renewing the lease.
+
+get() returns the stored quote when it is at most
+QUOTE_MAX_AGE_SECONDS old, so order executors usually price without
+waiting for Robinhood, and otherwise fetches the quote directly.
+"""
+
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+import broker
+import config
+import db
+import instruments
+import log
+import positions
+
+LEASE_NAME = 'quote_feed'
+
+_feed_pid = None
+_feed_lock = threading.Lock()
+
+# kept for the life of the process, so its threads (and their database
+# connections) are reused by every feed refresh
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.POSITION_ENRICHMENT_MAX_WORKERS,
+    thread_name_prefix='tradebox-market-data',
+)
+
+
+def get(option_id: str, fetched_after: float = 0.0) -> dict:
+    """Return market data for option_id, from the feed if fresh enough, otherwise from the broker.
+
+    A stored quote is only used if it was fetched after fetched_after
+    (unix time), so a retry is not priced from the quote that failed.
+    """
+    row = db.fetch_quote(option_id)
+    if row is not None and row[1] > fetched_after and time.time() - row[1] <= config.QUOTE_MAX_AGE_SECONDS:
+        return json.loads(row[0])
+
+    market_data = broker.get().get_quote(option_id)
+    if market_data is not None:
+        store({option_id: market_data})
+    return market_data
+
+
+def store(market_data_by_id: dict) -> None:
+    db.insert_quotes(
+        {option_id: json.dumps(market_data) for option_id, market_data in market_data_by_id.items()},
+        time.time(),
+    )
+
+
+def fetch_market_data(option_ids: list) -> dict:
+    """Return market data for many option ids, keyed by option id.
+
+    Instrument data comes from the instrument cache and market data is
+    requested MARKET_DATA_BATCH_SIZE instruments at a time.
+    Lookups run on a shared pool of POSITION_ENRICHMENT_MAX_WORKERS threads.
+    """
+    option_ids = list(dict.fromkeys(option_ids))
+    if len(option_ids) == 0:
+        return {}
+
+    instrument_urls = {}
+    for option_id, instrument_data in zip(option_ids, _executor.map(instruments.get_by_id, option_ids)):
+        if instrument_data is not None:
+            instrument_urls[instrument_data['url']] = option_id
+
+    urls = list(instrument_urls)
+    batches = [
+        urls[i:i + config.MARKET_DATA_BATCH_SIZE]
+        for i in range(0, len(urls), config.MARKET_DATA_BATCH_SIZE)
+    ]
+    batch_results = _executor.map(
+        broker.get().get_quotes,
+        batches,
+    )
+
+    market_data_by_id = {}
+    for results in batch_results:
+        for market_data in results:
+            # failed requests return [None]
+            if market_data is None:
+                continue
+            option_id = instrument_urls.get(market_data.get('instrument'), market_data.get('instrument_id'))
+            market_data_by_id[option_id] = market_data
+
+    return market_data_by_id
+
+
+def refresh() -> int:
+    """Fetch and store quotes for every watched option. Returns the number stored."""
+    option_ids = db.fetch_watched_option_ids()
+    # positions this process has already fetched; fetching them again
+    # on every interval would spend the positions rate limit
+    option_ids += [open_position['option_id'] for open_position in positions.book.cached()]
+
+    market_data_by_id = fetch_market_data(option_ids)
+    if market_data_by_id:
+        store(market_data_by_id)
+    return len(market_data_by_id)
+
+
+def start_feed() -> None:
+    """Run the quote feed in a background thread, once per process."""
+    global _feed_pid
+
+    if config.QUOTE_FEED_ENABLED is False or _feed_pid == os.getpid():
+        return
+
+    with _feed_lock:
+        if _feed_pid == os.getpid():
+            return
+        feed = threading.Thread(target=_feed_loop, name='tradebox-quotes', daemon=True)
+        feed.start()
+        _feed_pid = os.getpid()
+
+
+def _feed_loop() -> None:
+    last_error = None
+    while True:
+        started = time.monotonic()
+        try:
+            if db.claim_lease(LEASE_NAME, config.QUOTE_FEED_LEASE_SECONDS):
+                refresh()
+            last_error = None
+        except Exception as e:
+            # log a failure once, not on every interval
+            if repr(e) != last_error:
+                log.append(f'quotes._feed_loop(): Could not refresh quotes: {e!r}')
+            last_error = repr(e)
+
+        time.sleep(max(config.QUOTE_FEED_INTERVAL_SECONDS - (time.monotonic() - started), 0))
@@ -0,0 +1,138 @@
+"""Keeps broker calls within Robinhood's rate limits.
+
+Every Robinhood call takes a token from the bucket of its endpoint
+(placing orders, checking orders, cancelling, market data, ...) before
+it is sent. Buckets are stored in the database, so all server workers
+and the console share one budget per endpoint, configured in
+BROKER_RATE_LIMITS.
+
+A throttled call is retried after the time Robinhood asks for (the
+Retry-After header or "Expected available in N seconds"), or else after
+a jittered exponential backoff. The endpoint is blocked for every
+process in the meantime. ThrottledError is raised once
+BROKER_RATE_LIMIT_MAX_RETRIES retries have been throttled.
+"""
+
+import email.utils
+import random
+import re
+import threading
+import time
+
+import config
+import db
+import log
+
+AVAILABLE_IN_PATTERN = re.compile(r'available in (\d+(?:\.\d+)?) second', re.IGNORECASE)
+
+_local = threading.local()
+
+
+class ThrottledError(Exception):
+    """Robinhood kept throttling a call after all retries."""
+
+
+def call(endpoint: str, func, *args, **kwargs):
+    """Call func within endpoint's rate limit, retrying while it is throttled."""
+    for retry in range(config.BROKER_RATE_LIMIT_MAX_RETRIES + 1):
+        acquire(endpoint)
+
+        _local.throttled = False
+        _local.retry_after = None
+        try:
+            result = func(*args, **kwargs)
+        except Exception as ex:
+            response = getattr(ex, 'response', None)
+            if getattr(response, 'status_code', None) != 429:
+                raise
+            record_response(response)
+            result = None
+
+        retry_after = throttled_retry_after(result)
+        if retry_after is False:
+            return result
+
+        if retry == config.BROKER_RATE_LIMIT_MAX_RETRIES:
+            break
+
+        delay = backoff_delay(retry, retry_after)
+        db.block_rate_limit(endpoint, time.time() + delay)
+        msg = f'ratelimit.call(): {getattr(func, "__name__", func)} was throttled ({endpoint}). ' \
+            + f'Retrying in {round(delay, 2)} seconds (retry {retry + 1} of {config.BROKER_RATE_LIMIT_MAX_RETRIES}).'
+        log.append(msg)
+
+    raise ThrottledError(
+        f'{getattr(func, "__name__", func)} ({endpoint}) was still throttled after '
+        f'{config.BROKER_RATE_LIMIT_MAX_RETRIES} retries.'
+    )
+
+
+def acquire(endpoint: str) -> None:
+    """Wait until endpoint's bucket has a token and take it."""
+    limit = config.BROKER_RATE_LIMITS.get(endpoint)
+    if limit is None:
+        return
+    rate, burst = limit
+
+    while True:
+        wait = db.take_rate_limit_token(endpoint, rate, burst)
+        if wait <= 0:
+            return
+        time.sleep(wait)
+
+
+def record_response(response, *args, **kwargs) -> None:
+    """requests response hook that notes throttled responses for the calling thread."""
+    if getattr(response, 'status_code', None) != 429:
+        return
+    _local.throttled = True
+    _local.retry_after = retry_after_seconds(response)
+
+
+def throttled_retry_after(result):
+    """Return False if the last call was not throttled, else the seconds to wait (None if unknown)."""
+    if getattr(_local, 'throttled', False):
+        return _local.retry_after
+
+    # robin_stocks returns the error body of a throttled POST as the result,
+    # {'detail': 'Request was throttled. Expected available in 7 seconds.'}
+    if isinstance(result, dict) and 'throttled' in str(result.get('detail', '')).lower():
+        return _available_in(result['detail'])
+    return False
+
+
+def retry_after_seconds(response) -> float:
+    """Return the wait a 429 response asks for, or None if it does not say."""
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+
+    try:
+        return _available_in(response.json().get('detail', ''))
+    except Exception:
+        return None
+
+
+def _available_in(detail: str) -> float:
+    match = AVAILABLE_IN_PATTERN.search(str(detail))
+    return None if match is None else float(match.group(1))
+
+
+def backoff_delay(retry: int, retry_after: float = None) -> float:
+    if retry_after is not None:
+        # spread retries out so server workers do not all call at the same moment
+        return retry_after + random.uniform(0, config.BROKER_RATE_LIMIT_BACKOFF_INITIAL_SECONDS)
+
+    delay = min(
+        config.BROKER_RATE_LIMIT_BACKOFF_INITIAL_SECONDS * 2 ** retry,
+        config.BROKER_RATE_LIMIT_BACKOFF_MAX_SECONDS,
+    )
+    return random.uniform(delay / 2, delay)
@@ -0,0 +1,110 @@
+"""Recovers order executions interrupted by a crash or restart.
+
+Every execution and every broker order it places is journaled in the
+executions and execution_attempts tables. At startup, executions still
+marked running by a process that no longer exists are taken over: their
+live broker orders are cancelled and their fills recorded. If
+RESUME_INTERRUPTED_EXECUTIONS is set and the execution was interrupted
+less than RESUME_MAX_AGE_SECONDS ago, the remaining quantity is
+executed; otherwise the execution is marked interrupted and a
+notification is sent.
+"""
+
+import os
+import threading
+import time
+
+import config
+import db
+import log
+import pushover
+import session
+
+_recovery_pid = None
+_recovery_lock = threading.Lock()
+
+
+def start() -> None:
+    """Recover interrupted executions in a background thread, once per process."""
+    global _recovery_pid
+
+    if _recovery_pid == os.getpid():
+        return
+
+    with _recovery_lock:
+        if _recovery_pid == os.getpid():
+            return
+        recovery = threading.Thread(target=_recover_in_background, name='tradebox-recovery', daemon=True)
+        recovery.start()
+        _recovery_pid = os.getpid()
+
+
+def _recover_in_background() -> None:
+    try:
+        recover_interrupted_executions()
+    except Exception as e:
+        log.append(f'recovery._recover_in_background(): recovery failed: {e!r}')
+
+
+def recover_interrupted_executions() -> list:
+    """Take over executions left running by dead processes. Returns their order ids."""
+    recovered = []
+    for execution in db.fetch_running_executions():
+        if _process_is_alive(execution['pid']):
+            continue
+        # another server worker may be recovering the same execution
+        if db.claim_running_execution(execution['order_id'], execution['pid']) is False:
+            continue
+
+        recover_execution(execution)
+        recovered.append(execution['order_id'])
+    return recovered
+
+
+def recover_execution(execution: dict) -> None:
+    # imported here because tradeapi imports the modules that import this one
+    import tradeapi
+
+    order_id = execution['order_id']
+    msg = f'recovery.recover_execution(): order #{order_id} was interrupted while executing ' \
+        + f'(process {execution["pid"]}). Cancelling its live orders.'
+    log.append(msg)
+
+    session.ensure()
+    filled_quantity = tradeapi.cancel_journaled_orders(order_id)
+
+    order_info = db.get_order(order_id)
+    quantity = order_info.quantity if order_info is not None else 0
+    remaining_quantity = max(quantity - filled_quantity, 0)
+    interrupted_for = time.time() - execution['updated_at']
+
+    msg = f'recovery.recover_execution(): order #{order_id} filled {filled_quantity} of {quantity} ' \
+        + f'before it was interrupted {round(interrupted_for, 1)} seconds ago.'
+    log.append(msg)
+
+    if remaining_quantity == 0:
+        db.update_execution(order_id, status='completed')
+        return
+
+    if config.RESUME_INTERRUPTED_EXECUTIONS and interrupted_for <= config.RESUME_MAX_AGE_SECONDS:
+        tradeapi.resume_execution(order_id, remaining_quantity)
+        return
+
+    db.update_execution(order_id, status='interrupted')
+    pushover.send_notification(
+        f'INTERRUPTED#{order_id} filled {filled_quantity} of {quantity}. Live orders cancelled. Not resumed.'
+    )
+
+
+def _process_is_alive(pid: int) -> bool:
+    if pid is None:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
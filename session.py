@@ -0,0 +1,209 @@
+"""Keeps the Robinhood session logged in for order execution.
+
+ensure() logs in on first use (reusing the stored session in ~/.tokens
+when possible) and afterwards returns immediately until the session is
+close to expiring (ROBINHOOD_SESSION_REFRESH_MARGIN_SECONDS). Earlier,
+ROBINHOOD_SESSION_REFRESH_LEAD_SECONDS before it expires, a background
+timer logs in with credentials without blocking ensure(). One process
+at a time does this, holding a lease; it writes the new session to a
+temporary file and moves it over the stored session only on success.
+The other processes load the new stored session. Broker calls made
+through call() log in again and retry once when they fail because the
+session is no longer valid.
+"""
+
+import os
+import threading
+import time
+
+import broker
+import config
+import db
+import log
+
+PICKLE_PATH = os.path.join(os.path.expanduser('~'), '.tokens', 'robinhood.pickle')
+REFRESH_LEASE_NAME = 'robinhood_session_refresh'
+
+_lock = threading.RLock()
+_expires_at = None  # unix time the current session expires
+_issued_at = None  # unix time the current session was issued
+_session_pid = None
+_refresh_timer = None
+
+
+def login(mfa_code=None) -> dict:
+    with _lock:
+        res = broker.get().login(
+            config.ROBINHOOD_USERNAME,
+            config.ROBINHOOD_PASSWORD,
+            config.ROBINHOOD_SESSION_EXPIRES_IN,
+            mfa_code=mfa_code
+        )
+        _session_started()
+        return res
+
+
+def logout() -> None:
+    global _expires_at
+    with _lock:
+        _cancel_refresh()
+        _expires_at = None
+
+
+def invalidate() -> None:
+    """Forget the session so the next ensure() validates it again."""
+    global _expires_at
+    with _lock:
+        _expires_at = None
+
+
+def ensure() -> None:
+    """Make sure there is a usable session, logging in only if needed."""
+    if _session_is_fresh():
+        return
+
+    with _lock:
+        if _session_is_fresh():
+            return
+        res = login()
+        log.append(f'session.ensure(): Logged in to Robinhood: \n{res}')
+
+
+def _session_is_fresh() -> bool:
+    return (
+        _expires_at is not None
+        and _session_pid == os.getpid()
+        and time.time() < _expires_at - config.ROBINHOOD_SESSION_REFRESH_MARGIN_SECONDS
+    )
+
+
+def _session_started(issued_at: float = None) -> None:
+    global _expires_at, _issued_at, _session_pid
+
+    # robin_stocks does not record when the stored token was issued,
+    # so the pickle file's modification time is used instead
+    if issued_at is None:
+        try:
+            issued_at = os.path.getmtime(PICKLE_PATH)
+        except OSError:
+            issued_at = time.time()
+
+    _issued_at = issued_at
+    _expires_at = issued_at + int(config.ROBINHOOD_SESSION_EXPIRES_IN)
+    _session_pid = os.getpid()
+    _schedule_refresh()
+
+
+def _schedule_refresh(delay: float = None) -> None:
+    global _refresh_timer
+
+    _cancel_refresh()
+    if delay is None:
+        delay = max(_expires_at - config.ROBINHOOD_SESSION_REFRESH_LEAD_SECONDS - time.time(), 0)
+    _refresh_timer = threading.Timer(delay, _refresh_in_background)
+    _refresh_timer.daemon = True
+    _refresh_timer.start()
+
+
+def _cancel_refresh() -> None:
+    global _refresh_timer
+    if _refresh_timer is not None:
+        _refresh_timer.cancel()
+        _refresh_timer = None
+
+
+def _refresh_in_background() -> None:
+    """Replace the session with a new one before it expires.
+
+    Runs without holding _lock, so executions keep using the current
+    session while the new one is requested.
+    """
+    try:
+        if _stored_session_is_newer():
+            # another process has already refreshed the stored session
+            broker.get().login(
+                config.ROBINHOOD_USERNAME,
+                config.ROBINHOOD_PASSWORD,
+                config.ROBINHOOD_SESSION_EXPIRES_IN,
+                prompt=False,
+            )
+            issued_at = None
+            msg = 'session._refresh_in_background(): Loaded the Robinhood session refreshed by another process.'
+        elif db.claim_lease(REFRESH_LEASE_NAME, config.ROBINHOOD_SESSION_REFRESH_RETRY_SECONDS):
+            _login_to_new_session_file()
+            issued_at = time.time()
+            msg = 'session._refresh_in_background(): Refreshed Robinhood session.'
+        else:
+            # another process is refreshing; load its session once it is stored
+            _schedule_refresh(config.ROBINHOOD_SESSION_REFRESH_RETRY_SECONDS)
+            return
+    except Exception as e:
+        # a refresh that needs an MFA code has to be done from the console
+        msg = f'session._refresh_in_background(): Could not refresh Robinhood session: {e!r}\n' \
+            + f'Keeping the current session and retrying in {config.ROBINHOOD_SESSION_REFRESH_RETRY_SECONDS} seconds. ' \
+            + 'Log in from console.py if it has expired.'
+        log.append(msg)
+        _schedule_refresh(config.ROBINHOOD_SESSION_REFRESH_RETRY_SECONDS)
+        return
+
+    with _lock:
+        _session_started(issued_at)
+    log.append(msg)
+
+
+def _stored_session_is_newer() -> bool:
+    try:
+        return os.path.getmtime(PICKLE_PATH) > _issued_at
+    except (OSError, TypeError):
+        return False
+
+
+def _login_to_new_session_file() -> None:
+    """Log in with credentials and atomically replace the stored session with the new one."""
+    pickle_name = f'.refresh-{os.getpid()}'
+    new_session_path = os.path.join(os.path.dirname(PICKLE_PATH), f'robinhood{pickle_name}.pickle')
+
+    # robin_stocks would reuse a leftover file instead of logging in
+    _remove(new_session_path)
+    try:
+        broker.get().login(
+            config.ROBINHOOD_USERNAME,
+            config.ROBINHOOD_PASSWORD,
+            config.ROBINHOOD_SESSION_EXPIRES_IN,
+            pickle_name=pickle_name,
+            prompt=False,
+        )
+        if os.path.exists(new_session_path):
+            os.replace(new_session_path, PICKLE_PATH)
+    finally:
+        _remove(new_session_path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def is_auth_error(ex: Exception) -> bool:
+    response = getattr(ex, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) in (401, 403):
+        return True
+    # robin_stocks' login_required decorator
+    return 'can only be called when logged in' in str(ex)
+
+
+def call(func, *args, **kwargs):
+    """Call a Robinhood function, logging in again once on an auth error."""
+    try:
+        return func(*args, **kwargs)
+    except Exception as ex:
+        if is_auth_error(ex) is False:
+            raise
+        msg = f'session.call(): {getattr(func, "__name__", func)} failed with an auth error: {ex}\n' \
+            + 'Logging in again and retrying.'
+        log.append(msg)
+        invalidate()
+        ensure()
+        return func(*args, **kwargs)
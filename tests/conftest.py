@@ -0,0 +1,58 @@
+"""pytest setup for Tradebox.
+
+Tests import Tradebox modules with a temporary config.py that selects
+the simulated broker, so nothing is sent to Robinhood. Tests that use
+the database get an empty one of their own from the database fixture.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+TRADEBOX_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_config_dir = None
+
+
+def pytest_configure(config):
+    global _config_dir
+
+    _config_dir = tempfile.mkdtemp(prefix='tradebox-tests-')
+    with open(os.path.join(TRADEBOX_DIR, 'config-default-must-rename.py'), encoding='utf-8') as f:
+        config_source = f.read()
+
+    # later assignments override the defaults above them
+    overrides = {
+        'DATABASE_DIR': _config_dir,
+        'LOG_PARENT_DIR': _config_dir,
+        'BROKER': 'simulated',
+        'SIMULATED_BROKER_SEED': 1,
+        'QUOTE_FEED_ENABLED': False,
+    }
+    config_source += '\n\n# test overrides\n' + ''.join(
+        f'{name} = {value!r}\n' for name, value in overrides.items()
+    )
+    with open(os.path.join(_config_dir, 'config.py'), 'w', encoding='utf-8') as f:
+        f.write(config_source)
+
+    sys.path[:0] = [_config_dir, TRADEBOX_DIR]
+
+
+def pytest_unconfigure(config):
+    if 'log' in sys.modules:
+        sys.modules['log'].flush()
+    shutil.rmtree(_config_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point db at an empty database file for one test."""
+    import db
+
+    db.close_connection()
+    monkeypatch.setattr(db, 'DB_FILEPATH', str(tmp_path / 'tradebox.sqlite3'))
+    yield db
+    db.close_connection()
@@ -0,0 +1,107 @@
+import sqlite3
+
+
+def insert_order(db, active=True, execute_only_after_id=None, execution_deactivates_order_id=None) -> int:
+    return db.insert_order(
+        'buy', 'SPY', '2030-01-18', 500.0, 'call', 1, 'market',
+        False, active, '', '', execute_only_after_id, execution_deactivates_order_id, 10, 0.0, 'option-1',
+        0.01, 0.05, 3.0,
+    )
+
+
+def test_claim_order_marks_executed_once(database):
+    db = database
+    db.migrate()
+    order_id = insert_order(db)
+
+    order = db.claim_order(order_id)
+    assert order.order_id == order_id
+    assert order.executed is True and order.active is False
+    assert db.claim_order(order_id) is None
+    assert 'already executed' in db.claim_failure_reason(order_id)
+
+
+def test_claim_order_skips_inactive_and_unknown_orders(database):
+    db = database
+    db.migrate()
+    order_id = insert_order(db, active=False)
+
+    assert db.claim_order(order_id) is None
+    assert 'not active' in db.claim_failure_reason(order_id)
+    assert db.claim_order(order_id + 1) is None
+    assert db.claim_order('x') is None
+
+
+def test_claim_order_waits_for_prerequisite(database):
+    db = database
+    db.migrate()
+    prerequisite_id = insert_order(db)
+    order_id = insert_order(db, execute_only_after_id=prerequisite_id)
+
+    assert db.claim_order(order_id) is None
+    assert 'prerequisite' in db.claim_failure_reason(order_id)
+    assert db.fetch_released_order_ids(prerequisite_id) == []
+
+    assert db.claim_order(prerequisite_id) is not None
+    assert db.fetch_released_order_ids(prerequisite_id) == [order_id]
+    assert db.claim_order(order_id) is not None
+    assert db.fetch_released_order_ids(prerequisite_id) == []
+
+
+def test_claim_order_runs_when_prerequisite_was_deleted(database):
+    db = database
+    db.migrate()
+    prerequisite_id = insert_order(db)
+    order_id = insert_order(db, execute_only_after_id=prerequisite_id)
+    db.delete_order(prerequisite_id)
+
+    assert db.claim_order(order_id) is not None
+
+
+def test_claim_order_deactivates_linked_order(database):
+    db = database
+    db.migrate()
+    linked_id = insert_order(db)
+    order_id = insert_order(db, execution_deactivates_order_id=linked_id)
+
+    assert db.claim_order(order_id) is not None
+    linked = db.get_order(linked_id)
+    assert linked.active is False and linked.executed is False
+    assert db.claim_order(linked_id) is None
+
+
+def test_migrate_baseline_orders(database):
+    db = database
+    # the orders table as the original release created it, with values
+    # stored the way it stored them
+    conn = sqlite3.connect(db.DB_FILEPATH)
+    db._migrate_to_v1(conn)
+    rows = [
+        (1, '1', '2024-01-02 10:00:00', '0', '', '', 'BUY', 'SPY', 500.0, 'Call', '2030-01-18', 'option-1', 'Market', None, 2, '', '', 0.01, 0.05, 3.0, 10, 'True'),
+        (2, '1', '2024-01-02 10:00:00', '0', '', '', 'buy', 'SPY', 500.0, 'call', '2030-01-18', 'option-1', 'market', None, 0, '', '', 0.01, 0.05, 3.0, 10, 'False'),
+        (3, 'True', 'not a date', '0', '1', '', 'sell', 'SPY', 500.0, 'put', '2030-01-18', 'option-2', 'limit', 1.25, 1, '', '', None, None, None, 3, '0'),
+    ]
+    conn.executemany(f"INSERT INTO orders ({db.ORDERS_COLUMNS}) VALUES ({', '.join('?' * 22)});", rows)
+    conn.commit()
+    conn.close()
+
+    db.migrate()
+
+    assert db.schema_version() == len(db.MIGRATIONS)
+
+    market_order = db.get_order(1)
+    assert (market_order.buy_sell, market_order.call_put, market_order.market_limit) == ('buy', 'call', 'market')
+    assert market_order.execute_only_after_id is None
+    assert market_order.limit_price == 0.0
+    assert market_order.emergency_order_fill_on_failure is True
+
+    # quantity 0 fails the new constraints, so the row is kept aside
+    assert db.get_order(2) is None
+    quarantined = db.connection().execute("SELECT order_id FROM orders_quarantine;").fetchall()
+    assert quarantined == [(2,)]
+
+    limit_order = db.get_order(3)
+    assert limit_order.active is True
+    assert limit_order.created_at is None
+    assert limit_order.execute_only_after_id == 1
+    assert limit_order.below_tick is None and limit_order.cutoff_price is None
@@ -0,0 +1,29 @@
+import config
+import positions
+import tradeapi
+from test_prices import make_order
+
+
+def test_check_position_waits_for_the_position_to_update(monkeypatch):
+    reads = iter([3, 3, 5])
+    monkeypatch.setattr(config, 'ORDER_FILL_DETECTION', 'poll')
+    monkeypatch.setattr(config, 'ORDER_POLL_INITIAL_INTERVAL', 0.0)
+    monkeypatch.setattr(positions.book, 'quantity', lambda option_id, refresh=False: next(reads))
+
+    assert tradeapi.check_position(make_order(), 5) == 5
+
+
+def test_check_position_returns_the_last_read_after_timeout(monkeypatch):
+    monkeypatch.setattr(config, 'ORDER_FILL_DETECTION', 'poll')
+    monkeypatch.setattr(config, 'POSITION_SETTLE_TIMEOUT_SECONDS', 0.0)
+    monkeypatch.setattr(positions.book, 'quantity', lambda option_id, refresh=False: 3)
+
+    assert tradeapi.check_position(make_order(), 5) == 3
+
+
+def test_check_position_skips_a_failed_fetch(monkeypatch):
+    def fail(option_id, refresh=False):
+        raise positions.PositionFetchError('Could not fetch open option positions.')
+    monkeypatch.setattr(positions.book, 'quantity', fail)
+
+    assert tradeapi.check_position(make_order(), 5) is None
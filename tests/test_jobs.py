@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+import tradeapi
+from test_db import insert_order
+
+
+def wait_until_idle(timeout: float = 5.0) -> None:
+    # a job's status is recorded before its thread frees the instrument
+    deadline = time.monotonic() + timeout
+    while jobs._waiting and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.fixture(scope='module')
+def jobs_database(tmp_path_factory):
+    """One database for this module: job pool threads keep their connections between tests."""
+    import db
+
+    db.close_connection()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(db, 'DB_FILEPATH', str(tmp_path_factory.mktemp('jobs') / 'tradebox.sqlite3'))
+        db.migrate()
+        yield db
+        db.close_connection()
+
+
+def test_same_instrument_orders_do_not_hold_pool_threads(jobs_database, monkeypatch):
+    db = jobs_database
+    same_instrument = [insert_order(db) for _ in range(6)]
+    other_instrument = db.insert_order(
+        'buy', 'QQQ', '2030-01-18', 400.0, 'call', 1, 'market',
+        False, True, '', '', None, None, 10, 0.0, 'option-2', 0.01, 0.05, 3.0,
+    )
+
+    running = {}
+    overlaps = []
+    lock = threading.Lock()
+
+    def execute_order(order_id):
+        option_id = db.get_order(order_id).rh_option_uuid
+        with lock:
+            if running.get(option_id):
+                overlaps.append(order_id)
+            running[option_id] = True
+        time.sleep(0.05)
+        with lock:
+            running[option_id] = False
+    monkeypatch.setattr(tradeapi, 'execute_order', execute_order)
+
+    started = time.monotonic()
+    same_jobs = [jobs.submit(order_id) for order_id in same_instrument]
+    other_job = jobs.submit(other_instrument)
+
+    # the other instrument is not stuck behind the six queued orders
+    while jobs.get(other_job)['status'] != 'completed':
+        assert time.monotonic() - started < 0.15
+        time.sleep(0.01)
+
+    while any(jobs.get(job_id)['status'] != 'completed' for job_id in same_jobs):
+        assert time.monotonic() - started < 5
+        time.sleep(0.01)
+
+    assert overlaps == []
+    wait_until_idle()
+    assert jobs._waiting == {}
+
+
+def test_run_batch_waits_for_queued_orders(jobs_database, monkeypatch):
+    db = jobs_database
+    order_ids = [insert_order(db) for _ in range(3)]
+    monkeypatch.setattr(tradeapi, 'execute_order', lambda order_id: time.sleep(0.01))
+
+    results = jobs.run_batch(order_ids + [order_ids[-1] + 100])
+
+    assert [result['status'] for result in results] == ['completed'] * 4
+    wait_until_idle()
+    assert jobs._waiting == {}
@@ -0,0 +1,70 @@
+import db
+import tradeapi
+
+
+def make_order(**fields) -> db.Order:
+    values = {
+        'order_id': 1, 'active': True, 'created_at': None, 'executed': False,
+        'execute_only_after_id': None, 'execution_deactivates_order_id': None,
+        'buy_sell': 'buy', 'symbol': 'SPY', 'strike': 500.0, 'call_put': 'call',
+        'expiration_date': '2030-01-18', 'rh_option_uuid': 'option-1', 'market_limit': 'limit',
+        'limit_price': 1.5, 'quantity': 1, 'message_on_success': '', 'message_on_failure': '',
+        'below_tick': 0.01, 'above_tick': 0.05, 'cutoff_price': 3.0,
+        'max_order_attempts': 3, 'emergency_order_fill_on_failure': False,
+    }
+    values.update(fields)
+    return db.Order(**values)
+
+
+def test_round_to_tick_below_cutoff():
+    order = make_order()
+    assert tradeapi.round_to_tick(1.234, order) == 1.23
+    assert tradeapi.round_to_tick(1.235, order) == 1.24
+    assert tradeapi.round_to_tick(1.231, order, 'up') == 1.24
+    assert tradeapi.round_to_tick(1.239, order, 'down') == 1.23
+
+
+def test_round_to_tick_above_cutoff():
+    order = make_order()
+    assert tradeapi.round_to_tick(3.12, order) == 3.1
+    assert tradeapi.round_to_tick(3.11, order, 'up') == 3.15
+    assert tradeapi.round_to_tick(3.14, order, 'down') == 3.1
+
+
+def test_round_to_tick_across_cutoff():
+    order = make_order()
+    # 2.999 rounds up to the cutoff, where prices move in 0.05 steps
+    assert tradeapi.round_to_tick(2.999, order, 'up') == 3.0
+    assert tradeapi.round_to_tick(2.995, order, 'down') == 2.99
+
+
+def test_round_to_tick_minimum_and_missing_ticks():
+    assert tradeapi.round_to_tick(0.001, make_order(), 'down') == 0.01
+    order = make_order(below_tick=None, above_tick=None, cutoff_price=None)
+    assert tradeapi.round_to_tick(4.567, order) == 4.57
+
+
+def test_limit_buy_walks_from_mid_to_ask():
+    order = make_order(buy_sell='buy', limit_price=1.5, max_order_attempts=3)
+    prices = [tradeapi.limit_order_price(1.0, 1.2, order, attempt) for attempt in range(5)]
+    assert prices == [1.1, 1.15, 1.2, 1.2, 1.2]
+
+
+def test_limit_sell_walks_from_mid_to_bid():
+    order = make_order(buy_sell='sell', limit_price=0.9, max_order_attempts=3)
+    prices = [tradeapi.limit_order_price(1.0, 1.2, order, attempt) for attempt in range(3)]
+    assert prices == [1.1, 1.05, 1.0]
+
+
+def test_limit_price_never_passes_limit():
+    buy = make_order(buy_sell='buy', limit_price=1.05)
+    sell = make_order(buy_sell='sell', limit_price=1.15)
+    for attempt in range(3):
+        assert tradeapi.limit_order_price(1.0, 1.2, buy, attempt) == 1.05
+        assert tradeapi.limit_order_price(1.0, 1.2, sell, attempt) == 1.15
+
+
+def test_limit_price_rounds_mid_toward_the_market():
+    # mid is 1.025: buys round up and sells round down
+    assert tradeapi.limit_order_price(1.0, 1.05, make_order(buy_sell='buy'), 0) == 1.03
+    assert tradeapi.limit_order_price(1.0, 1.05, make_order(buy_sell='sell', limit_price=0.5), 0) == 1.02
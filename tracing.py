@@ -0,0 +1,58 @@
+"""Records how long each phase of an order execution takes.
+
+Spans are written as JSON lines to logs/trace-YYYY-MM-DD.jsonl and are
+tagged with the order id and attempt number of the execution running
+on the current thread.
+
+Example:
+with tracing.order_context(order_id):
+    with tracing.span('login'):
+        login()
+"""
+
+import contextlib
+import threading
+import time
+
+import log
+
+_context = threading.local()
+
+
+@contextlib.contextmanager
+def order_context(order_id: int):
+    previous = (getattr(_context, 'order_id', None), getattr(_context, 'attempt', None))
+    _context.order_id = order_id
+    _context.attempt = None
+    try:
+        yield
+    finally:
+        _context.order_id, _context.attempt = previous
+
+
+def set_attempt(attempt: int) -> None:
+    _context.attempt = attempt
+
+
+@contextlib.contextmanager
+def span(name: str, **tags):
+    started_at = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as ex:
+        error = repr(ex)
+        raise
+    finally:
+        record = {
+            'span': name,
+            'order_id': getattr(_context, 'order_id', None),
+            'attempt': getattr(_context, 'attempt', None),
+            'started_at': started_at,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            **tags,
+        }
+        if error is not None:
+            record['error'] = error
+        log.append_json('trace', record)
@@ -2,27 +2,39 @@
 and helper functions to actions on the local database.
 """
 
+import concurrent.futures
+import dataclasses
 import datetime
+import decimal
 import json
 import os
 import time
 
-import pandas as pd
-import robin_stocks.robinhood as r
-
+import broker
 import config
 import db
+import instruments
+import jobs
+import lazy
 import log
+import positions
 import pushover
+import quotes
+import session
+import tracing
+
+pd = lazy.LazyModule('pandas')
+
+# Robinhood option order states
+FILLED_ORDER_STATES = ('filled', 'partially_filled')
+TERMINAL_ORDER_STATES = ('filled', 'cancelled', 'rejected', 'failed')
+
+# used when an order has no tick information
+DEFAULT_TICK = 0.01
 
 
 def login(mfa_code=None) -> None:
-    res = r.login(
-        config.ROBINHOOD_USERNAME,
-        config.ROBINHOOD_PASSWORD,
-        expiresIn=config.ROBINHOOD_SESSION_EXPIRES_IN,
-        mfa_code=mfa_code
-    )
+    res = session.login(mfa_code=mfa_code)
 
     msg = f'tradeapi.login(): Logged in to Robinhood: \n{res}'
     log.append(msg)
@@ -30,16 +42,14 @@ def login(mfa_code=None) -> None:
 
 def logout() -> None:
     try:
-        r.logout()
+        broker.get().logout()
     except Exception as e:
         log.append(f"Exception raised in tradeapi.logout(): {e}")
 
+    session.logout()
+
     try:
-        home_dir = os.path.expanduser("~")
-        robinhood_tokens_dir = os.path.join(home_dir, ".tokens")
-        robinhood_creds_file = "robinhood.pickle"
-        pickle_path = os.path.join(robinhood_tokens_dir, robinhood_creds_file)
-        os.remove(pickle_path)
+        os.remove(session.PICKLE_PATH)
     except FileNotFoundError as e:
         log.append(f"Exception raised in tradeapi.logout(): {e}")
 
@@ -62,7 +72,8 @@ def create_order(
         execution_deactivates_order_id: int,
         max_order_attempts: int,
         limit_price: float = 0.0
-    ) -> None:
+    ) -> int:
+    """Store a new order. Returns its order_id, or None if the option does not exist."""
     msg = 'tradeapi.create_order(): Begin creating order.'
     log.append(msg)
 
@@ -70,7 +81,7 @@ def create_order(
     msg = 'Attempt to fetch option instrument data for order:\n' \
         + f'{symbol} {expiration_date} {strike} {call_put}'
     log.append(msg)
-    instrument_data = r.options.get_option_instrument_data(
+    instrument_data = instruments.get(
         symbol, expiration_date, strike, call_put
     )
     msg = f'Instrument data fetch result: {instrument_data}'
@@ -79,7 +90,7 @@ def create_order(
 
     if instrument_data is None:
         msg = (
-            'tradeapi.create_order(): r.options.get_option_instrument_data('
+            'tradeapi.create_order(): instruments.get('
             + f'{symbol}, {expiration_date}, {strike}, {call_put}) '
             + 'returned None. Option likely does not exist. '
             + 'Possible invalid symbol, strike, expiration date, and/or type (call/put). ' \
@@ -94,7 +105,7 @@ def create_order(
         cutoff_price = instrument_data['min_ticks']['cutoff_price']
 
 
-    db.insert_order(
+    order_id = db.insert_order(
         buy_sell,
         symbol,
         expiration_date,
@@ -117,96 +128,144 @@ def create_order(
     )
 
 
-    msg = 'Successfully created order for ' \
+    msg = f'Successfully created order #{order_id} for ' \
         + f'{buy_sell} {quantity} {symbol}, {expiration_date}, {strike}, {call_put}.'
     log.append(msg)
+    return order_id
 
 
 def execute_order(order_id: int) -> None:
-    msg = f'Begin tradeapi.py:execute_order() for order {order_id}.'
-    log.append(msg)
-
-    login()
-
-    # get order information from local database
-    try:
-        order_info = db.get_order_series(order_id)
-    except KeyError:
-        msg = f'Looks like order #{order_id} does not exist. Aborting tradeapi.execute_order({order_id}).'
-        log.append(msg)
-        return
+    with tracing.order_context(order_id), tracing.span('execute_order'):
+        _execute_order(order_id)
 
 
-    # abort if inactive
-    if bool(int(order_info['active'])) is False:
-        msg = f'tradeapi.execute_order(): order #{order_id} is not active. Aborting execution.'
-        log.append(msg)
-        return
+def _execute_order(order_id: int) -> None:
+    msg = f'Begin tradeapi.py:execute_order() for order {order_id}.'
+    log.append(msg)
 
-    # abort if executed
-    if bool(int(order_info['executed'])) is True:
-        msg = f'tradeapi.execute_order(): order #{order_id} has already executed. Aborting execution.'
+    # reuses the cached session unless it is about to expire
+    jobs.report(phase='login')
+    with tracing.span('login'):
+        session.ensure()
+
+    # claim the order: one transaction checks that it is active, not
+    # executed and that its prerequisite has executed, then marks it
+    # executed, inactive, and deactivates its linked order
+    jobs.report(phase='checks')
+    with tracing.span('db_claim'):
+        order_info = db.claim_order(order_id)
+    if order_info is None:
+        msg = f'tradeapi.execute_order(): {db.claim_failure_reason(order_id)} ' \
+            + f'Aborting execution of order #{order_id}.'
         log.append(msg)
+        jobs.report(phase='skipped', detail=msg)
         return
 
+    db.start_execution(order_id, order_info.buy_sell)
 
-    # continue execution 
-    # if prequisitve order
-    # exists and has executed
-    msg = f'Checking to see if prerequisite order #"{order_info['execute_only_after_id']}" exists.'
+    msg = f'Claimed order #{order_id}: marked executed and inactive.'
+    if order_info.execution_deactivates_order_id is not None:
+        msg += f' Deactivated order #{order_info.execution_deactivates_order_id}. (execution deactivates order id#)'
     log.append(msg)
-    if db.order_exists(order_info['execute_only_after_id']) is True:
-        if db.get_order_executed_status(order_info['execute_only_after_id']) is True:
-            msg = f'Prerequisite order exists and has executed.\n' \
-            + f'Continuing execution of order #{order_id}.'  
-            log.append(msg)
-        else:
-            msg = f'Prerequisite order exists but has not executed.\n' \
-            + f'Cancelling execution of order #{order_id}.'
-            log.append(msg)
-            return
-    else:
-        msg = f'Prerequisite order #{order_info["execute_only_after_id"]} does not exist. ' \
-            + f'Continuing execution of order #{order_id}.'
-        log.append(msg)
-        pass
-    
 
-    # mark trade as executed
-    db.set_order_executed_status(order_id, True)
-    log.append(f'Updated order number {order_id} as executed.')
 
-    # set order as inactive
-    db.set_order_active_status(order_id, False)
-    log.append(f'Updated order number {order_id} as inactive.')
+    # select correct order function
+    # and execute order
+    try:
+        executed = dispatch_order(order_info)
+    except Exception:
+        # leave nothing live on the book for an execution that stopped early.
+        # failures before the claim must not touch the execution row, which
+        # may belong to an earlier run of the order
+        _fail_execution(order_id, 'execute_order')
+        raise
+    db.update_execution(order_id, status='completed')
+    if executed is False:
+        return
+
 
-    # deactivate check
-    msg = f'Attempting to deactivate order #{order_info["execution_deactivates_order_id"]}. (execution deactivates order id#)'
+    msg = f'Completed tradeapi.execute_order({order_id}).'
     log.append(msg)
-    db.set_order_active_status(order_info['execution_deactivates_order_id'], False)
+    jobs.report(phase='done')
 
 
-    # select correct order function
-    # and execute order
-    if order_info['buy_sell'] == 'buy' and order_info['market_limit'] == 'market':
+def dispatch_order(order_info: db.Order) -> bool:
+    """Run the executor for the order's type. Returns False if there is none."""
+    if order_info.buy_sell == 'buy' and order_info.market_limit == 'market':
         execute_market_buy_order(order_info)
-    elif order_info['buy_sell'] == 'sell' and order_info['market_limit'] == 'market':
+    elif order_info.buy_sell == 'sell' and order_info.market_limit == 'market':
         execute_market_sell_order(order_info)
+    elif order_info.buy_sell in ('buy', 'sell') and order_info.market_limit == 'limit':
+        execute_limit_order(order_info)
     else:
         msg = 'No valid order type selected.\n' \
-            + f'buy/sell: {order_info["buy_sell"]}\n' \
-            + f'market/limit: {order_info["market_limit"]}'
+            + f'buy/sell: {order_info.buy_sell}\n' \
+            + f'market/limit: {order_info.market_limit}'
+        log.append(msg)
+        jobs.report(phase='skipped', detail=msg)
+        return False
+    return True
+
+
+def cancel_journaled_orders(order_id: int) -> int:
+    """Cancel every journaled broker order of an execution that may still be live.
+
+    Records what each order filled and returns the execution's total
+    filled quantity.
+    """
+    open_attempts = db.fetch_open_execution_attempts(order_id)
+    log.append(f'tradeapi.cancel_journaled_orders(): cancelling {len(open_attempts)} orders of order #{order_id}.')
+    cancel_orders([rh_order_id for _, rh_order_id in open_attempts])
+
+    for attempt_id, rh_order_id in open_attempts:
+        if rh_order_id is None:
+            db.set_execution_attempt_state(attempt_id, 'failed', 0)
+            continue
+        order_state = broker.get().get_order(rh_order_id)
+        filled_quantity, _ = order_fill(order_state)
+        if order_state is not None:
+            db.set_execution_attempt_state(attempt_id, _order_state_name(order_state), filled_quantity)
+
+    return db.fetch_execution_filled_quantity(order_id)
+
+
+def resume_execution(order_id: int, remaining_quantity: int) -> None:
+    """Execute the rest of an interrupted order. The order stays claimed."""
+    order_info = db.get_order(order_id)
+    with tracing.order_context(order_id), tracing.span('resume_execution'):
+        msg = f'tradeapi.resume_execution(): resuming order #{order_id} for the remaining {remaining_quantity}.'
         log.append(msg)
+        db.update_execution(order_id, status='running', pid=os.getpid())
+        try:
+            dispatch_order(dataclasses.replace(order_info, quantity=remaining_quantity))
+        except Exception:
+            _fail_execution(order_id, 'resume_execution')
+            raise
+        db.update_execution(order_id, status='completed')
 
 
-    msg = f'Completed tradeapi.execute_order({order_id}).'
-    log.append(msg)
+def _fail_execution(order_id: int, caller: str) -> None:
+    """Cancel the live orders of an execution that raised and mark it failed.
+
+    A failed cleanup is only logged, so the caller re-raises the original exception.
+    """
+    try:
+        cancel_journaled_orders(order_id)
+    except Exception as e:
+        msg = f'tradeapi.{caller}(): Could not cancel the orders of order #{order_id} after it failed: {e!r}\n' \
+            + 'Check Robinhood for orders left open.'
+        log.append(msg)
+    finally:
+        try:
+            db.update_execution(order_id, status='failed')
+        except Exception as e:
+            log.append(f'tradeapi.{caller}(): Could not mark the execution of order #{order_id} failed: {e!r}')
 
 
 def get_option_instrument_data(
     symbol: str, call_put: str, strike: float, expiration_date: str
 ) -> tuple[float, float, float, str]:
-    data = r.options.get_option_instrument_data(
+    data = instruments.get(
         symbol, expiration_date, strike, call_put
     )
 
@@ -218,10 +277,349 @@ def get_option_instrument_data(
     return below_tick, above_tick, cutoff_price, option_uuid
 
 
-def execute_market_buy_order(order_info: pd.Series) -> None:
+def wait_for_order_state(rh_order_id: str, states: tuple, timeout: float) -> dict:
+    """Poll a Robinhood order until it reaches one of states or timeout passes.
+
+    Polling starts fast and backs off to ORDER_POLL_MAX_INTERVAL.
+    Returns the last order info fetched.
+    """
+    deadline = time.monotonic() + timeout
+    interval = config.ORDER_POLL_INITIAL_INTERVAL
+    order_state = None
+
+    while True:
+        order_state = broker.get().get_order(rh_order_id)
+        if order_state is not None and order_state.get('state') in states:
+            return order_state
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return order_state
+
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, config.ORDER_POLL_MAX_INTERVAL)
+
+
+def wait_for_fill(rh_order_id: str) -> None:
+    # Pause for order execution
+    with tracing.span('wait_for_fill'):
+        if config.ORDER_FILL_DETECTION == 'poll':
+            order_state = wait_for_order_state(
+                rh_order_id,
+                FILLED_ORDER_STATES + TERMINAL_ORDER_STATES,
+                config.ORDER_FILL_TIMEOUT_SECONDS,
+            )
+            log.append(f'Order ID {rh_order_id} state after fill wait: {_order_state_name(order_state)}')
+        else:
+            time.sleep(2)
+
+
+def wait_for_settlement(rh_order_id: str) -> dict:
+    """Wait for a cancelled order to settle on RH servers and return its final order info."""
+    with tracing.span('wait_for_settlement'):
+        if config.ORDER_FILL_DETECTION == 'poll':
+            order_state = wait_for_order_state(
+                rh_order_id,
+                TERMINAL_ORDER_STATES,
+                config.ORDER_SETTLE_TIMEOUT_SECONDS,
+            )
+        else:
+            time.sleep(3)
+            order_state = broker.get().get_order(rh_order_id)
+        log.append(f'Order ID {rh_order_id} state after cancel: {_order_state_name(order_state)}')
+        return order_state
+
+
+def check_position(order_info: db.Order, expected_size: int) -> int:
+    """Compare the open position with the size expected from fills and return it.
+
+    Robinhood updates positions shortly after orders fill, so in 'poll'
+    mode the position is fetched again until it matches or
+    POSITION_SETTLE_TIMEOUT_SECONDS pass. Returns None if the position
+    could not be fetched. Reports are built from fills, not from this.
+    """
+    timeout = config.POSITION_SETTLE_TIMEOUT_SECONDS if config.ORDER_FILL_DETECTION == 'poll' else 0.0
+    deadline = time.monotonic() + timeout
+    interval = config.ORDER_POLL_INITIAL_INTERVAL
+    position_size = None
+
+    with tracing.span('position_refresh'):
+        while True:
+            try:
+                position_size = positions.book.quantity(order_info.rh_option_uuid, refresh=True) or 0
+            except positions.PositionFetchError as e:
+                log.append(f'tradeapi.check_position(): {e} Skipping the position check.')
+                return None
+            if position_size == expected_size:
+                return position_size
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, config.ORDER_POLL_MAX_INTERVAL)
+
+    msg = f'Position size {position_size} does not match the size expected from fills ' \
+        + f'({expected_size}). Another order may have traded this contract.'
+    log.append(msg)
+    return position_size
+
+
+def order_fill(order_state: dict) -> tuple:
+    """Return (filled quantity, average fill price) from an order's execution records.
+
+    Returns (None, None) when the order info is missing, so that the
+    caller can fall back to the position.
+    """
+    if order_state is None or order_state.get('processed_quantity') is None:
+        return None, None
+
+    filled_quantity = int(float(order_state['processed_quantity']))
+
+    executed_value = 0.0
+    executed_quantity = 0.0
+    for leg in order_state.get('legs', []):
+        for execution in leg.get('executions', []):
+            executed_value += float(execution['price']) * float(execution['quantity'])
+            executed_quantity += float(execution['quantity'])
+    average_price = round(executed_value / executed_quantity, 4) if executed_quantity else None
+
+    return filled_quantity, average_price
+
+
+def _average_price(previous_quantity: int, previous_price: float, quantity: int, price: float) -> float:
+    if price is None or quantity == 0:
+        return previous_price
+    if previous_price is None or previous_quantity == 0:
+        return price
+    return round((previous_quantity * previous_price + quantity * price) / (previous_quantity + quantity), 4)
+
+
+def _order_state_name(order_state: dict) -> str:
+    if order_state is None:
+        return 'unknown'
+    return order_state.get('state', 'unknown')
+
+
+def tick_size(price: float, order_info: db.Order) -> decimal.Decimal:
+    """Return the price increment Robinhood accepts for the contract at price.
+
+    Prices below cutoff_price move in below_tick increments and prices
+    at or above it in above_tick increments.
+    """
+    below_tick = order_info.below_tick or DEFAULT_TICK
+    above_tick = order_info.above_tick or below_tick
+    if order_info.cutoff_price and price >= order_info.cutoff_price:
+        return decimal.Decimal(str(above_tick))
+    return decimal.Decimal(str(below_tick))
+
+
+def round_to_tick(price: float, order_info: db.Order, rounding: str = 'nearest') -> float:
+    """Round price to a valid tick for the contract.
+
+    rounding is 'up', 'down' or 'nearest'. Buys round up and sells
+    round down when the price must not be less aggressive than asked.
+    """
+    decimal_rounding = {
+        'up': decimal.ROUND_CEILING,
+        'down': decimal.ROUND_FLOOR,
+        'nearest': decimal.ROUND_HALF_UP,
+    }[rounding]
+
+    def to_tick(tick: decimal.Decimal) -> decimal.Decimal:
+        ticks = (decimal.Decimal(str(price)) / tick).quantize(decimal.Decimal(1), rounding=decimal_rounding)
+        return ticks * tick
+
+    tick = tick_size(price, order_info)
+    rounded = to_tick(tick)
+    # rounding can cross cutoff_price, where the tick size changes
+    rounded_tick = tick_size(float(rounded), order_info)
+    if rounded_tick != tick:
+        rounded = to_tick(rounded_tick)
+
+    return max(float(rounded), float(tick_size(0.0, order_info)))
+
+
+def limit_order_price(bid_price: float, ask_price: float, order_info: db.Order, attempt: int) -> float:
+    """Return the price for an attempt of a limit order.
+
+    The first attempt is placed at the mid price and each attempt after
+    it moves an equal step toward limit_price, reaching it on the last
+    attempt. The walk stops at the far side of the spread (the ask for
+    buys, the bid for sells) when that is better than limit_price, and
+    prices never pass limit_price.
+    """
+    mid_price = (bid_price + ask_price) / 2
+    if order_info.buy_sell == 'buy':
+        target_price = min(order_info.limit_price, max(ask_price, mid_price))
+    else:
+        target_price = max(order_info.limit_price, min(bid_price, mid_price))
+
+    last_attempt = max(order_info.max_order_attempts - 1, 1)
+    fraction = min(attempt / last_attempt, 1.0)
+    price = mid_price + (target_price - mid_price) * fraction
+
+    if order_info.buy_sell == 'buy':
+        return min(round_to_tick(price, order_info, 'up'), round_to_tick(order_info.limit_price, order_info, 'down'))
+    return max(round_to_tick(price, order_info, 'down'), round_to_tick(order_info.limit_price, order_info, 'up'))
+
+
+def execute_limit_order(order_info: db.Order) -> None:
+    """Work a limit order from the mid price toward limit_price.
+
+    Each attempt places the remaining quantity at the next price from
+    limit_order_price(), waits for a fill and cancels what is left.
+    Emergency fills are not used for limit orders, since they would
+    trade past limit_price.
+    """
+    start_timestamp = datetime.datetime.now().strftime('%H:%M:%S')
+    msg = f'Begin execute_limit_order for order #{order_info.order_id} at {start_timestamp}.'
+    log.append(msg)
+    log.append(f'Tradebox order info: \n{order_info.to_string()}')
+
+    if not order_info.limit_price or order_info.limit_price <= 0:
+        msg = f'Order #{order_info.order_id} has no limit price ({order_info.limit_price}). Exiting limit order.'
+        log.append(msg)
+        jobs.report(phase='skipped', detail=msg)
+        return
+
+    buying = order_info.buy_sell == 'buy'
+
+    with tracing.span('position_refresh'):
+        opening_position_size = positions.book.quantity(order_info.rh_option_uuid, refresh=True)
+    if opening_position_size is None:
+        if buying is False:
+            msg = (
+                'No open position found for order # '
+                + f'{order_info.order_id}, RH option ID: {order_info.rh_option_uuid}.\n'
+                + 'Exiting limit sell order.'
+            )
+            log.append(msg)
+            return
+        opening_position_size = 0
+
+    if buying:
+        goal_final_position_size = opening_position_size + order_info.quantity
+    else:
+        goal_final_position_size = max(opening_position_size - order_info.quantity, 0)
+    current_position_size = opening_position_size
+    log.append(f'Opening position size: {opening_position_size}')
+    log.append(f'Goal final position size: {goal_final_position_size}')
+
+    number_of_trades_placed = 0
+    total_filled_quantity = 0
+    last_price = None
+    order_cancel_ids = []
+    quote_fetched_after = 0.0
+
+    jobs.report(phase='buying' if buying else 'selling')
+    db.update_execution(order_info.order_id, opening_position_size=opening_position_size, goal_final_position_size=goal_final_position_size)
+
+    while current_position_size != goal_final_position_size and number_of_trades_placed < order_info.max_order_attempts:
+        tracing.set_attempt(number_of_trades_placed + 1)
+        remaining_quantity_to_execute = abs(goal_final_position_size - current_position_size)
+
+        with tracing.span('market_data'):
+            option_market_data = quotes.get(order_info.rh_option_uuid, quote_fetched_after)
+        log.append(f'Current raw market data: {json.dumps(option_market_data)}')
+        bid_price = float(option_market_data['bid_price'])
+        ask_price = float(option_market_data['ask_price'])
+        mid_price = (bid_price + ask_price) / 2
+
+        price = limit_order_price(bid_price, ask_price, order_info, number_of_trades_placed)
+        msg = (
+            f'LIMIT {order_info.buy_sell.upper()}: ORDER NUMBER {number_of_trades_placed + 1} '
+            + f'OF MAXIMUM {order_info.max_order_attempts}\n'
+            + f'Attempting to {order_info.buy_sell} {remaining_quantity_to_execute} options at {price} '
+            + f'(mid {round(mid_price, 4)}, limit {order_info.limit_price}, previous {last_price})'
+        )
+        log.append(msg)
+        last_price = price
+
+        # a retry is priced from a quote fetched while this order was live,
+        # which the feed usually has by the time the order is cancelled
+        quote_fetched_after = time.time()
+        with tracing.span('place_order'):
+            if buying:
+                order_result = broker.get().buy_option_limit(
+                    'open', 'debit', price, order_info.symbol, remaining_quantity_to_execute,
+                    order_info.expiration_date, order_info.strike,
+                    option_type=order_info.call_put, time_in_force='gtc',
+                )
+            else:
+                order_result = broker.get().sell_option_limit(
+                    'close', 'credit', price, order_info.symbol, remaining_quantity_to_execute,
+                    order_info.expiration_date, order_info.strike,
+                    option_type=order_info.call_put, time_in_force='gtc',
+                )
+        log.append(f'RH order result dump:\n {json.dumps(order_result)}')
+        attempt_id = db.insert_execution_attempt(
+            order_info.order_id, 'limit', number_of_trades_placed + 1,
+            order_result.get('id'), price, remaining_quantity_to_execute,
+        )
+        number_of_trades_placed += 1
+
+        wait_for_fill(order_result['id'])
+
+        log.append(f'Cancelling order ID {order_result["id"]}.')
+        try:
+            with tracing.span('cancel'):
+                broker.get().cancel_order(order_result['id'])
+        except Exception as e:
+            log.append(f'Error cancelling {order_result["id"]}: {e!r}')
+        order_cancel_ids.append(order_result['id'])
+
+        order_state = wait_for_settlement(order_result['id'])
+
+        filled_quantity, average_price = order_fill(order_state)
+        if filled_quantity is None:
+            log.append(f'No order info for order ID {order_result["id"]}. Using position to find filled quantity.')
+            with tracing.span('position_refresh'):
+                position_size = positions.book.quantity(order_info.rh_option_uuid, refresh=True) or 0
+            filled_quantity = abs(position_size - current_position_size)
+        current_position_size += filled_quantity if buying else -filled_quantity
+        total_filled_quantity += filled_quantity
+        log.append(f'Order ID {order_result["id"]} filled {filled_quantity} at average price {average_price}. '
+                   + f'Updated current position size: {current_position_size}')
+
+        db.set_execution_attempt_state(attempt_id, _order_state_name(order_state), filled_quantity)
+        jobs.report(
+            attempts=number_of_trades_placed,
+            filled_quantity=total_filled_quantity,
+        )
+
+    tracing.set_attempt(None)
+
+    check_position(order_info, current_position_size)
+
+    message = (
+        f'{"BUY" if buying else "SELL"}LExd#{order_info.order_id}'
+        + f'{order_info.symbol}{order_info.call_put}'
+        + f'{order_info.expiration_date}{order_info.strike}'
+        + f'Cur{current_position_size}'
+        + f'St{opening_position_size}'
+        + f'Gl{goal_final_position_size}'
+        + f'Lm{order_info.limit_price}'
+    )
+    log.append(message)
+    if current_position_size != goal_final_position_size:
+        log.append('tradeapi.execute_limit_order did not fill completely within limit price.')
+
+    with tracing.span('notification'):
+        pushover.send_notification(message)
+    log.append('Email/text notification sent.')
+
+    jobs.report(phase='cleanup')
+    log.append(f'Cancelling {len(order_cancel_ids)} orders for safety.')
+    cancel_orders(order_cancel_ids)
+
+    log.append('Completed execute_limit_order.')
+
+
+def execute_market_buy_order(order_info: db.Order) -> None:
     # log timestamp
     start_timestamp = datetime.datetime.now().strftime('%H:%M:%S')
-    msg = f'Begin execute_market_buy_order for order #{order_info["order_id"]} at {start_timestamp}.'
+    msg = f'Begin execute_market_buy_order for order #{order_info.order_id} at {start_timestamp}.'
     log.append(msg)
 
 
@@ -236,22 +634,24 @@ def execute_market_buy_order(order_info: pd.Series) -> None:
         'current_position_size': 'undefined',
         'goal_final_position_size': 'undefined',
         'actual_closing_position_size': 'undefined',
-        'max_order_attempts': order_info['max_order_attempts'],
+        'max_order_attempts': order_info.max_order_attempts,
         'remaining_quantity_to_execute': 'undefined',
+        'filled_quantity': 0,
+        'average_fill_price': None,
     }
 
 
     # establish initial position information
     robinhood_reported_current_position_size = None
-    open_option_positions = r.options.get_open_option_positions()
-    for open_pos in open_option_positions:
-        if open_pos['option_id'] == order_info['rh_option_uuid']:
-            msg = (
-                'Existing position info before any trades: \n'
-                + f'{json.dumps(open_pos)}'
-            )
-            log.append(msg)
-            robinhood_reported_current_position_size = int(float(open_pos['quantity']))
+    with tracing.span('position_refresh'):
+        open_pos = positions.book.get(order_info.rh_option_uuid, refresh=True)
+    if open_pos is not None:
+        msg = (
+            'Existing position info before any trades: \n'
+            + f'{json.dumps(open_pos)}'
+        )
+        log.append(msg)
+        robinhood_reported_current_position_size = int(float(open_pos['quantity']))
 
     if robinhood_reported_current_position_size is None:
         trade_progress_info['current_position_size'] = 0
@@ -265,7 +665,7 @@ def execute_market_buy_order(order_info: pd.Series) -> None:
 
 
     # establish goal position size
-    trade_progress_info['goal_final_position_size'] = trade_progress_info['current_position_size'] + int(order_info['quantity'])
+    trade_progress_info['goal_final_position_size'] = trade_progress_info['current_position_size'] + order_info.quantity
 
     msg = 'Calculated goal final position size: ' \
         + f'{trade_progress_info["goal_final_position_size"]}'
@@ -274,6 +674,14 @@ def execute_market_buy_order(order_info: pd.Series) -> None:
 
     # list of order IDs to cancel during order cleanup
     order_cancel_ids = []
+    quote_fetched_after = 0.0
+
+    jobs.report(phase='buying')
+    db.update_execution(
+        order_info.order_id,
+        opening_position_size=trade_progress_info['opening_position_size'],
+        goal_final_position_size=trade_progress_info['goal_final_position_size'],
+    )
 
 
     # MAIN ORDER LOOP
@@ -285,13 +693,16 @@ def execute_market_buy_order(order_info: pd.Series) -> None:
         log.append(msg)
         
 
+        tracing.set_attempt(trade_progress_info['number_of_trades_placed'] + 1)
+
         # Calculate remaining quantity to buy
         trade_progress_info['remaining_quantity_to_execute'] = trade_progress_info['goal_final_position_size'] - trade_progress_info['current_position_size']
         msg = f'Remaining quantity to buy: {trade_progress_info["remaining_quantity_to_execute"]}'
         log.append(msg)
 
         # Get Robinhood option market data
-        option_market_data = r.options.get_option_market_data_by_id(order_info['rh_option_uuid'])[0]
+        with tracing.span('market_data'):
+            option_market_data = quotes.get(order_info.rh_option_uuid, quote_fetched_after)
         log.append(f'Current raw market data: {json.dumps(option_market_data)}')
 
         # log qty and ask price
@@ -301,31 +712,39 @@ def execute_market_buy_order(order_info: pd.Series) -> None:
         )
         log.append(msg)
 
+        # a retry is priced from a quote fetched while this order was live,
+        # which the feed usually has by the time the order is cancelled
+        quote_fetched_after = time.time()
         # place order
-        order_result = r.orders.order_buy_option_limit(
-            'open',
-            'debit',
-            option_market_data['ask_price'],
-            order_info['symbol'],
-            trade_progress_info['remaining_quantity_to_execute'],
-            order_info['expiration_date'],
-            order_info['strike'],
-            optionType=order_info['call_put'],
-            timeInForce='gtc',
-        )
+        with tracing.span('place_order'):
+            order_result = broker.get().buy_option_limit(
+                'open',
+                'debit',
+                option_market_data['ask_price'],
+                order_info.symbol,
+                trade_progress_info['remaining_quantity_to_execute'],
+                order_info.expiration_date,
+                order_info.strike,
+                option_type=order_info.call_put,
+                time_in_force='gtc',
+            )
         log.append(f'RH order result dump:\n {json.dumps(order_result)}')
+        attempt_id = db.insert_execution_attempt(
+            order_info.order_id, 'market', trade_progress_info['number_of_trades_placed'] + 1,
+            order_result.get('id'), float(option_market_data['ask_price']), trade_progress_info['remaining_quantity_to_execute'],
+        )
 
         # Iterate number of trades placed
         trade_progress_info['number_of_trades_placed'] += 1
         log.append(f'Number of trades placed: {trade_progress_info["number_of_trades_placed"]}')
 
-        # Pause for order execution
-        time.sleep(2)
+        wait_for_fill(order_result['id'])
 
         # Cancel order after pause
         log.append(f'Cancelling order ID {order_result["id"]}.')
         try:
-            res = r.orders.cancel_option_order(order_result['id'])
+            with tracing.span('cancel'):
+                res = broker.get().cancel_order(order_result['id'])
             log.append(f'Order ID {order_result["id"]} cancelled.')
         except:
             msg = f'Error cancelling {order_result["id"]}.\n' \
@@ -334,23 +753,35 @@ def execute_market_buy_order(order_info: pd.Series) -> None:
         # Add order to cleanup list
         order_cancel_ids.append(order_result['id'])
 
-        # Wait for positions to update on RH servers
-        time.sleep(3)
-
-        # Update position information
-        open_option_positions = r.options.get_open_option_positions()
-        msg = (
-            'Updated raw position info after trade:\n'
-            + f'{json.dumps(open_option_positions)}'
+        order_state = wait_for_settlement(order_result['id'])
+
+        # Update fill information from the order's own executions
+        filled_quantity, average_price = order_fill(order_state)
+        if filled_quantity is None:
+            log.append(f'No order info for order ID {order_result["id"]}. Using position to find filled quantity.')
+            with tracing.span('position_refresh'):
+                position_size = positions.book.quantity(order_info.rh_option_uuid, refresh=True) or 0
+            filled_quantity = position_size - trade_progress_info['current_position_size']
+        trade_progress_info['average_fill_price'] = _average_price(
+            trade_progress_info['filled_quantity'], trade_progress_info['average_fill_price'], filled_quantity, average_price
         )
-        log.append(msg)
-        for open_pos in open_option_positions:
-            if open_pos['option_id'] == order_info['rh_option_uuid']:
-                trade_progress_info['current_position_size'] = int(float(open_pos['quantity']))
-        msg = f'Updated current position qty: {trade_progress_info["current_position_size"]}'
+        trade_progress_info['filled_quantity'] += filled_quantity
+        trade_progress_info['current_position_size'] += filled_quantity
+        msg = f'Order ID {order_result["id"]} filled {filled_quantity} at average price {average_price}.\n' \
+            + f'Updated current position qty: {trade_progress_info["current_position_size"]}'
         log.append(msg)
 
-    time.sleep(3)
+        db.set_execution_attempt_state(attempt_id, _order_state_name(order_state), filled_quantity)
+        jobs.report(
+            attempts=trade_progress_info['number_of_trades_placed'],
+            filled_quantity=trade_progress_info['filled_quantity'],
+        )
+
+    tracing.set_attempt(None)
+
+    # Wait for positions to update on RH servers
+    if config.ORDER_FILL_DETECTION != 'poll':
+        time.sleep(3)
 
     #
     # TRADE REPORTING 
@@ -358,33 +789,27 @@ def execute_market_buy_order(order_info: pd.Series) -> None:
     # CLEANUP
     #
 
-    # Establish final position information
-    open_option_positions = r.options.get_open_option_positions()
-    for open_pos in open_option_positions:
-        if open_pos['option_id'] == order_info['rh_option_uuid']:
-            trade_progress_info['current_position_size'] = int(float(open_pos['quantity']))
-            trade_progress_info['actual_closing_position_size'] = trade_progress_info['current_position_size']
+    # Check the position against the fills
+    trade_progress_info['actual_closing_position_size'] = check_position(
+        order_info, trade_progress_info['current_position_size']
+    )
+    log.append(f'Filled quantity: {trade_progress_info["filled_quantity"]} at average price {trade_progress_info["average_fill_price"]}')
     log.append(f'Opening position size: {trade_progress_info["opening_position_size"]}')
     log.append(f'Current position size: {trade_progress_info["current_position_size"]}')
     log.append(f'Goal final position size: {trade_progress_info["goal_final_position_size"]}')
     log.append(f'Actual closing position size: {trade_progress_info["actual_closing_position_size"]}')
     log.append(f'Final number of trades placed: {trade_progress_info["number_of_trades_placed"]}')
 
-    if trade_progress_info['actual_closing_position_size'] == 'undefined':
-        quantity_bought = 0
-    else:
-        quantity_bought = trade_progress_info['actual_closing_position_size'] - trade_progress_info['opening_position_size']
-
 
     # build message to email/text
     # message_part_one will be sent alone
     # if emergency order fill is not activated
     # otherwise it will be prepended to the emergency order email/text
     email_message_part_one = (
-        f'BUYExd#{order_info["order_id"]}'
-        + f'{order_info["symbol"]}{order_info["call_put"]}'
-        + f'{order_info["expiration_date"]}{order_info["strike"]}'
-        + f'Cur{trade_progress_info["actual_closing_position_size"]}'
+        f'BUYExd#{order_info.order_id}'
+        + f'{order_info.symbol}{order_info.call_put}'
+        + f'{order_info.expiration_date}{order_info.strike}'
+        + f'Cur{trade_progress_info["current_position_size"]}'
         + f'St{trade_progress_info["opening_position_size"]}'
         + f'Gl{trade_progress_info["goal_final_position_size"]}'
     )
@@ -395,40 +820,36 @@ def execute_market_buy_order(order_info: pd.Series) -> None:
     # Emergency fill if goal quantity not met
     if trade_progress_info['current_position_size'] < trade_progress_info['goal_final_position_size']:
         log.append('tradeapi.execute_market_buy_order did not fill completely.')
-        if bool(order_info['emergency_order_fill_on_failure']) is True:
+        if order_info.emergency_order_fill_on_failure is True:
             log.append('Emergency buy fill is activated. Executing emergency fill.')
+            jobs.report(phase='emergency_fill')
             quantity_to_buy =  trade_progress_info['goal_final_position_size'] - trade_progress_info['current_position_size']
             execute_buy_emergency_fill(order_info, quantity_to_buy, email_message_part_one)
         else:
             log.append('No emergency fill is ordered. Goal quantity met was not met, but emegency fill was not set to execute.')
-            pushover.send_notification(email_message_part_one)
+            with tracing.span('notification'):
+                pushover.send_notification(email_message_part_one)
             log.append('Email/text notification sent.')
     else:
         log.append('No emergency fill required based on position quantity.')
-        pushover.send_notification(email_message_part_one)
+        with tracing.span('notification'):
+            pushover.send_notification(email_message_part_one)
         log.append('Email/text notification sent.')
 
 
     # Re-cancel all orders at conclusion
+    jobs.report(phase='cleanup')
     log.append(f'Cancelling {len(order_cancel_ids)} orders for safety.')
-    for cancel_id in order_cancel_ids:
-        try:
-            log.append(f'Cancelling order ID {cancel_id}.')
-            res = r.orders.cancel_option_order(order_result['id'])
-        except:
-            msg = f'Error cancelling order ID {cancel_id}.\n' \
-                + f'RH cancel_option_order res dump: \n{json.dumps(res)}'
-            log.append(msg)
-        time.sleep(4)
+    cancel_orders(order_cancel_ids)
 
     log.append('Cancelled all order IDs from execute_market_buy_order.')
     log.append('Completed execute_market_buy_order.')
 
 
-def execute_market_sell_order(order_info: pd.Series) -> None:
+def execute_market_sell_order(order_info: db.Order) -> None:
     # log timestamp
     start_timestamp = datetime.datetime.now().strftime('%H:%M:%S')
-    msg = f'Begin execute_market_sell_order for order #{order_info["order_id"]} at {start_timestamp}.'
+    msg = f'Begin execute_market_sell_order for order #{order_info.order_id} at {start_timestamp}.'
     log.append(msg)
 
 
@@ -443,22 +864,24 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
         'current_position_size': 'undefined',
         'goal_final_position_size': 'undefined',
         'actual_closing_position_size': 'undefined',
-        'max_order_attempts': order_info['max_order_attempts'],
+        'max_order_attempts': order_info.max_order_attempts,
         'remaining_quantity_to_execute': 'undefined',
+        'filled_quantity': 0,
+        'average_fill_price': None,
     }
 
 
     # establish initial position information
     robinhood_reported_current_position_size = None
-    open_option_positions = r.options.get_open_option_positions()
-    for open_pos in open_option_positions:
-        if open_pos['option_id'] == order_info['rh_option_uuid']:
-            msg = (
-                'Existing position info before any trades: \n'
-                + f'{json.dumps(open_pos)}'
-            )
-            log.append(msg)
-            robinhood_reported_current_position_size = int(float(open_pos['quantity']))
+    with tracing.span('position_refresh'):
+        open_pos = positions.book.get(order_info.rh_option_uuid, refresh=True)
+    if open_pos is not None:
+        msg = (
+            'Existing position info before any trades: \n'
+            + f'{json.dumps(open_pos)}'
+        )
+        log.append(msg)
+        robinhood_reported_current_position_size = int(float(open_pos['quantity']))
 
 
     # Exit if position is not found (e.g. probably don't own it)
@@ -466,7 +889,7 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
     if robinhood_reported_current_position_size is None:
         msg = (
             'No open position found for order # '
-            + f'{order_info["order_id"]}, RH option ID: {order_info["rh_option_uuid"]}.\n'
+            + f'{order_info.order_id}, RH option ID: {order_info.rh_option_uuid}.\n'
             + 'Exiting market sell order.'
         )
         log.append(msg)
@@ -479,7 +902,7 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
 
 
     # Calculate goal_final_position_size
-    trade_progress_info['goal_final_position_size'] = trade_progress_info['opening_position_size'] - int(order_info['quantity'])
+    trade_progress_info['goal_final_position_size'] = trade_progress_info['opening_position_size'] - order_info.quantity
 
 
     # In case the quantity to sell is greater than the total owned,
@@ -498,6 +921,14 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
 
     # Collect order IDs to cancel at conclusion
     order_cancel_ids = []
+    quote_fetched_after = 0.0
+
+    jobs.report(phase='selling')
+    db.update_execution(
+        order_info.order_id,
+        opening_position_size=trade_progress_info['opening_position_size'],
+        goal_final_position_size=trade_progress_info['goal_final_position_size'],
+    )
 
 
     while (trade_progress_info['current_position_size'] > trade_progress_info['goal_final_position_size']) and (trade_progress_info['number_of_trades_placed'] < trade_progress_info['max_order_attempts']):
@@ -508,13 +939,16 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
         log.append(msg)
         
 
+        tracing.set_attempt(trade_progress_info['number_of_trades_placed'] + 1)
+
         # Calculate remaining quantity to sell
         trade_progress_info['remaining_quantity_to_execute'] = trade_progress_info['current_position_size'] - trade_progress_info['goal_final_position_size']
         msg = f'Remaining quantity to sell: {trade_progress_info["remaining_quantity_to_execute"]}'
         log.append(msg)
 
         # Get Robinhood option market data
-        option_market_data = r.options.get_option_market_data_by_id(order_info['rh_option_uuid'])[0]
+        with tracing.span('market_data'):
+            option_market_data = quotes.get(order_info.rh_option_uuid, quote_fetched_after)
         log.append(f'Current raw market data: {json.dumps(option_market_data)}')
         this_order_sell_price = float(option_market_data['bid_price'])
         if this_order_sell_price == 0.0:
@@ -527,31 +961,39 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
         )
         log.append(msg)
         
+        # a retry is priced from a quote fetched while this order was live,
+        # which the feed usually has by the time the order is cancelled
+        quote_fetched_after = time.time()
         # Place order
-        order_result = r.orders.order_sell_option_limit(
-            'close',
-            'credit',
-            this_order_sell_price,
-            order_info['symbol'],
-            trade_progress_info['remaining_quantity_to_execute'],
-            order_info['expiration_date'],
-            order_info['strike'],
-            optionType=order_info['call_put'],
-            timeInForce='gtc',
-        )
+        with tracing.span('place_order'):
+            order_result = broker.get().sell_option_limit(
+                'close',
+                'credit',
+                this_order_sell_price,
+                order_info.symbol,
+                trade_progress_info['remaining_quantity_to_execute'],
+                order_info.expiration_date,
+                order_info.strike,
+                option_type=order_info.call_put,
+                time_in_force='gtc',
+            )
         log.append(f'RH order result dump:\n {json.dumps(order_result)}')
+        attempt_id = db.insert_execution_attempt(
+            order_info.order_id, 'market', trade_progress_info['number_of_trades_placed'] + 1,
+            order_result.get('id'), this_order_sell_price, trade_progress_info['remaining_quantity_to_execute'],
+        )
 
         # Iterate number of trades placed
         trade_progress_info['number_of_trades_placed'] += 1
         log.append(f'Number of trades placed: {trade_progress_info["number_of_trades_placed"]}')
 
-        # Pause for order execution
-        time.sleep(2)
+        wait_for_fill(order_result['id'])
 
         # Cancel order after pause
         log.append(f'Cancelling order ID {order_result["id"]}.')
         try:
-            res = r.orders.cancel_option_order(order_result['id'])
+            with tracing.span('cancel'):
+                res = broker.get().cancel_order(order_result['id'])
             log.append(f'Order ID {order_result["id"]} cancelled.')
         except:
             msg = (
@@ -562,27 +1004,35 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
         # Add order to cleanup list
         order_cancel_ids.append(order_result['id'])
 
-        # Wait for positions to update on RH servers
-        time.sleep(3)
-
-        # Update position information
-        position_still_exists = False
-        open_option_positions = r.options.get_open_option_positions()
-        msg = (
-            'Updated raw position info after trade:\n'
-            + f'{json.dumps(open_option_positions)}'
+        order_state = wait_for_settlement(order_result['id'])
+
+        # Update fill information from the order's own executions
+        filled_quantity, average_price = order_fill(order_state)
+        if filled_quantity is None:
+            log.append(f'No order info for order ID {order_result["id"]}. Using position to find filled quantity.')
+            with tracing.span('position_refresh'):
+                position_size = positions.book.quantity(order_info.rh_option_uuid, refresh=True) or 0
+            filled_quantity = trade_progress_info['current_position_size'] - position_size
+        trade_progress_info['average_fill_price'] = _average_price(
+            trade_progress_info['filled_quantity'], trade_progress_info['average_fill_price'], filled_quantity, average_price
         )
+        trade_progress_info['filled_quantity'] += filled_quantity
+        trade_progress_info['current_position_size'] -= filled_quantity
+        msg = f'Order ID {order_result["id"]} filled {filled_quantity} at average price {average_price}.\n' \
+            + f'Updated current position size: {trade_progress_info["current_position_size"]}'
         log.append(msg)
-        for open_pos in open_option_positions:
-            if open_pos['option_id'] == order_info['rh_option_uuid']:
-                trade_progress_info['current_position_size'] = int(float(open_pos['quantity']))
-                position_still_exists = True
-        if position_still_exists is False:
-            trade_progress_info['current_position_size'] = 0
-        msg = f'Updated current position size: {trade_progress_info["current_position_size"]}'
-        log.append(msg)
 
-    time.sleep(3)
+        db.set_execution_attempt_state(attempt_id, _order_state_name(order_state), filled_quantity)
+        jobs.report(
+            attempts=trade_progress_info['number_of_trades_placed'],
+            filled_quantity=trade_progress_info['filled_quantity'],
+        )
+
+    tracing.set_attempt(None)
+
+    # Wait for positions to update on RH servers
+    if config.ORDER_FILL_DETECTION != 'poll':
+        time.sleep(3)
 
     #
     # TRADE REPORTING 
@@ -590,12 +1040,11 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
     # CLEANUP
     #
 
-    # Establish final position information
-    open_option_positions = r.options.get_open_option_positions()
-    for open_pos in open_option_positions:
-        if open_pos['option_id'] == order_info['rh_option_uuid']:
-            trade_progress_info['current_position_size'] = int(float(open_pos['quantity']))
-            trade_progress_info['actual_closing_position_size'] = int(float(open_pos['quantity']))
+    # Check the position against the fills
+    trade_progress_info['actual_closing_position_size'] = check_position(
+        order_info, trade_progress_info['current_position_size']
+    )
+    log.append(f'Filled quantity: {trade_progress_info["filled_quantity"]} at average price {trade_progress_info["average_fill_price"]}')
     log.append(f'Opening position size: {trade_progress_info["opening_position_size"]}')
     log.append(f'Current position size: {trade_progress_info["current_position_size"]}')
     log.append(f'Goal final position size: {trade_progress_info["goal_final_position_size"]}')
@@ -604,9 +1053,9 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
 
     # build initial message report
     email_message_part_one = (
-        f'SELLExd#{order_info["order_id"]}'
-        + f'{order_info["symbol"]}{order_info["call_put"]}'
-        + f'{order_info["expiration_date"]}{order_info["strike"]}'
+        f'SELLExd#{order_info.order_id}'
+        + f'{order_info.symbol}{order_info.call_put}'
+        + f'{order_info.expiration_date}{order_info.strike}'
         + f'Cur{trade_progress_info["current_position_size"]}'
         + f'St{trade_progress_info["opening_position_size"]}'
         + f'Gl{trade_progress_info["goal_final_position_size"]}'
@@ -615,51 +1064,102 @@ def execute_market_sell_order(order_info: pd.Series) -> None:
 
 
     # Emergency fill if goal quantity not met
-    if bool(int(order_info['emergency_order_fill_on_failure'])) is True:
+    if order_info.emergency_order_fill_on_failure is True:
         log.append('Emergency fill enabled.')
-        if isinstance(trade_progress_info['actual_closing_position_size'], int) and (trade_progress_info['actual_closing_position_size'] > trade_progress_info['goal_final_position_size']):
+        if trade_progress_info['current_position_size'] > trade_progress_info['goal_final_position_size']:
             log.append('Emergency fill executing.')
-            quantity_to_sell = trade_progress_info['actual_closing_position_size'] - trade_progress_info['goal_final_position_size']
+            jobs.report(phase='emergency_fill')
+            quantity_to_sell = trade_progress_info['current_position_size'] - trade_progress_info['goal_final_position_size']
             execute_sell_emergency_fill(order_info, quantity_to_sell, email_message_part_one)
         else:
             log.append('Emergency fill not required based on current position size.')
             log.append(email_message_part_one)
-            pushover.send_notification(email_message_part_one)
+            with tracing.span('notification'):
+                pushover.send_notification(email_message_part_one)
             log.append('Email/text notification sent.')
     else:
         log.append('No emergency fill ordered.')
         log.append(email_message_part_one)
-        pushover.send_notification(email_message_part_one)
+        with tracing.span('notification'):
+            pushover.send_notification(email_message_part_one)
         log.append('Email/text notification sent.')
 
 
     # Re-cancel all orders at conclusion
+    jobs.report(phase='cleanup')
     log.append(f'Cancelling {len(order_cancel_ids)} orders for safety.')
-    for cancel_id in order_cancel_ids:
-        try:
-            log.append(f'Cancelling order ID {cancel_id}.')
-            res = r.orders.cancel_option_order(order_result['id'])
-        except:
-            msg = f'Error cancelling order ID {cancel_id}.\n' \
-                + f'RH cancel_option_order res dump: \n{json.dumps(res)}'
-            log.append(msg)
-        time.sleep(4)
+    cancel_orders(order_cancel_ids)
 
     log.append('Cancelled all order IDs from execute_market_sell_order.')
     log.append('Completed execute_market_sell_order.')
 
 
+def cancel_orders(rh_order_ids: list) -> dict:
+    """Cancel orders concurrently and confirm that each one reached a terminal state.
+
+    Runs on a pool of CANCEL_MAX_WORKERS threads, so the sweep takes
+    about one cancel and one state check regardless of the number of
+    orders. Returns a summary with the final state of every order.
+    """
+    rh_order_ids = [rh_order_id for rh_order_id in dict.fromkeys(rh_order_ids) if rh_order_id is not None]
+    summary = {'requested': len(rh_order_ids), 'states': {}, 'not_terminal': [], 'errors': {}}
+    if len(rh_order_ids) == 0:
+        return summary
+
+    def cancel(rh_order_id: str) -> tuple:
+        error = None
+        try:
+            broker.get().cancel_order(rh_order_id)
+        except Exception as e:
+            # the order may already be filled or cancelled; its state is checked below
+            error = repr(e)
+        order_state = wait_for_order_state(rh_order_id, TERMINAL_ORDER_STATES, config.ORDER_SETTLE_TIMEOUT_SECONDS)
+        return rh_order_id, _order_state_name(order_state), error
+
+    with tracing.span('cancel_orders', orders=len(rh_order_ids)):
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(config.CANCEL_MAX_WORKERS, len(rh_order_ids))
+        ) as pool:
+            results = list(pool.map(cancel, rh_order_ids))
+
+    for rh_order_id, state, error in results:
+        summary['states'][rh_order_id] = state
+        if state not in TERMINAL_ORDER_STATES:
+            summary['not_terminal'].append(rh_order_id)
+        if error is not None:
+            summary['errors'][rh_order_id] = error
+
+    msg = f'tradeapi.cancel_orders(): {summary["requested"]} orders, ' \
+        + f'{summary["requested"] - len(summary["not_terminal"])} confirmed terminal.\n' \
+        + f'States: {json.dumps(summary["states"])}'
+    if summary['not_terminal']:
+        msg += f'\nNOT CONFIRMED: {summary["not_terminal"]}'
+    if summary['errors']:
+        msg += f'\nCancel errors: {json.dumps(summary["errors"])}'
+    log.append(msg)
+
+    return summary
+
+
 def cancel_all_robinhood_orders() -> None:
-    r.orders.cancel_all_option_orders()
+    broker.get().cancel_all_orders()
+
 
+def get_option_market_data_batch(option_ids: list) -> dict:
+    """Return market data for many option ids, keyed by option id."""
+    return quotes.fetch_market_data(option_ids)
 
-def get_console_open_robinhood_positions() -> pd.DataFrame:
-    open_positions = r.options.get_open_option_positions()
+
+def get_console_open_robinhood_positions() -> 'pd.DataFrame':
+    open_positions = positions.book.all()
+
+    option_ids = [open_position["option_id"] for open_position in open_positions]
+    market_data_by_id = get_option_market_data_batch(option_ids)
 
     display_positions = []
 
     for open_position in open_positions:
-        instrument_data = r.options.get_option_instrument_data_by_id(
+        instrument_data = instruments.get_by_id(
             open_position["option_id"]
         )
         quantity = int(float(open_position["quantity"]))
@@ -669,11 +1169,11 @@ def get_console_open_robinhood_positions() -> pd.DataFrame:
         call_put = instrument_data["type"]
         expiration_date = instrument_data["expiration_date"]
 
-        market_data = r.options.get_option_market_data_by_id(
-            open_position["option_id"]
-        )[0]
-
-        adjusted_mark_price = round(float(market_data["adjusted_mark_price"]), 2)
+        market_data = market_data_by_id.get(open_position["option_id"])
+        if market_data is None:
+            adjusted_mark_price = None
+        else:
+            adjusted_mark_price = round(float(market_data["adjusted_mark_price"]), 2)
 
         display_position = {
             "symbol": symbol,
@@ -691,15 +1191,16 @@ def get_console_open_robinhood_positions() -> pd.DataFrame:
     return positions_dataframe
 
 
-def execute_sell_emergency_fill(order_info: pd.Series, quantity_to_sell: int, prepend_message: str = '') -> None:
+def execute_sell_emergency_fill(order_info: db.Order, quantity_to_sell: int, prepend_message: str = '') -> None:
     msg = (
         f'Emergency sell: trying to sell {quantity_to_sell} qty '
-        + f'{order_info["symbol"]} {order_info["call_put"]} '
-        + f'{order_info["strike"]} {order_info["expiration_date"]}'
+        + f'{order_info.symbol} {order_info.call_put} '
+        + f'{order_info.strike} {order_info.expiration_date}'
     )
     log.append(msg)
 
-    option_market_data = r.options.get_option_market_data_by_id(order_info['rh_option_uuid'])[0]
+    with tracing.span('market_data'):
+        option_market_data = quotes.get(order_info.rh_option_uuid)
 
     bid_price = round(float(option_market_data['bid_price']), 2)
     log.append(f'Emergency sell: bid price {bid_price}')
@@ -708,34 +1209,39 @@ def execute_sell_emergency_fill(order_info: pd.Series, quantity_to_sell: int, pr
     sell_price = round(bid_price / 2, 2)
     log.append(f'Emergency sell: 50% discount sell price {sell_price}')
 
-    # find nearest tick (just using .05 cents here)
-    sell_price = round(round(sell_price * 10) / 10, 2)
-    if sell_price == 0:  # in case the option has bottomed out
-        sell_price = 0.01
+    # round down to a valid tick; round_to_tick() never returns less than one tick,
+    # in case the option has bottomed out
+    sell_price = round_to_tick(sell_price, order_info, 'down')
 
     log.append(f'Emergency sell: revised sell price {sell_price}')
 
-    order_result = r.orders.order_sell_option_limit(
-        'close',
-        'credit',
-        sell_price,
-        order_info['symbol'],
-        quantity_to_sell,
-        order_info['expiration_date'],
-        order_info['strike'],
-        optionType=order_info['call_put'],
-        timeInForce='gtc',
-    )
+    with tracing.span('place_order'):
+        order_result = broker.get().sell_option_limit(
+            'close',
+            'credit',
+            sell_price,
+            order_info.symbol,
+            quantity_to_sell,
+            order_info.expiration_date,
+            order_info.strike,
+            option_type=order_info.call_put,
+            time_in_force='gtc',
+        )
 
     log.append(f'Emergency sell: RH data sell order result: {json.dumps(order_result)}')
+    attempt_id = db.insert_execution_attempt(
+        order_info.order_id, 'emergency', 1, order_result.get('id'), sell_price, quantity_to_sell,
+    )
 
     time.sleep(20)
 
     try:
-        res = r.orders.cancel_option_order(order_result['id'])
+        with tracing.span('cancel'):
+            res = broker.get().cancel_order(order_result['id'])
     except:
         log.append('Error cancelling order after emergency sell fill.')
         res = ''
+    db.set_execution_attempt_state(attempt_id, 'cancel_requested')
     msg = (
         'Emergency order made. Cancelled order after 20 seconds. '
         + f'Result of cancellation: {json.dumps(res)}'
@@ -744,11 +1250,10 @@ def execute_sell_emergency_fill(order_info: pd.Series, quantity_to_sell: int, pr
 
     time.sleep(2)
 
-    open_option_positions = r.options.get_open_option_positions()
-    after_emergency_position_quantity = 'none'
-    for open_pos in open_option_positions:
-        if open_pos['option_id'] == order_info['rh_option_uuid']:
-            after_emergency_position_quantity = int(float(open_pos['quantity']))
+    with tracing.span('position_refresh'):
+        after_emergency_position_quantity = positions.book.quantity(order_info.rh_option_uuid, refresh=True)
+    if after_emergency_position_quantity is None:
+        after_emergency_position_quantity = 'none'
 
     msg = (
         'emergency sell: quantity after emergency sell '
@@ -761,20 +1266,22 @@ def execute_sell_emergency_fill(order_info: pd.Series, quantity_to_sell: int, pr
     )
     log.append(f'{prepend_message} {msg}')
 
-    pushover.send_notification(f'{prepend_message} {msg}')
+    with tracing.span('notification'):
+        pushover.send_notification(f'{prepend_message} {msg}')
     log.append('Email/text notification sent. Emergency fill executed.')
 
 
-def execute_buy_emergency_fill(order_info: pd.Series, quantity_to_buy: int, prepend_message: str = '') -> None:
+def execute_buy_emergency_fill(order_info: db.Order, quantity_to_buy: int, prepend_message: str = '') -> None:
     msg = (
         f'emergency buy: trying to buy {quantity_to_buy} '
-        + f'{order_info["symbol"]} {order_info["call_put"]} '
-        + f'{order_info["strike"]} {order_info["expiration_date"]}'
+        + f'{order_info.symbol} {order_info.call_put} '
+        + f'{order_info.strike} {order_info.expiration_date}'
     )
     log.append(msg)
 
 
-    option_market_data = r.options.get_option_market_data_by_id(order_info['rh_option_uuid'])[0]
+    with tracing.span('market_data'):
+        option_market_data = quotes.get(order_info.rh_option_uuid)
 
     ask_price = round(float(option_market_data['ask_price']), 2)
     log.append(f'emergency buy: bid price {ask_price}')
@@ -783,32 +1290,38 @@ def execute_buy_emergency_fill(order_info: pd.Series, quantity_to_buy: int, prep
     buy_price = round((ask_price * 1.5) + 0.05, 2)
     log.append(f'emergency buy: 50% higher buy price plus 5 cents {buy_price}')
 
-    # find nearest tick (just using .05 cents here)
-    buy_price = round(round(buy_price * 10) / 10, 2)
+    # round up to a valid tick
+    buy_price = round_to_tick(buy_price, order_info, 'up')
     log.append(f'emergency buy: rounded buy price {buy_price}')
 
 
-    order_result = r.orders.order_buy_option_limit(
-        'close',
-        'debit',
-        buy_price,
-        order_info['symbol'],
-        quantity_to_buy,
-        order_info['expiration_date'],
-        order_info['strike'],
-        optionType=order_info['call_put'],
-        timeInForce='gtc',
-    )
+    with tracing.span('place_order'):
+        order_result = broker.get().buy_option_limit(
+            'close',
+            'debit',
+            buy_price,
+            order_info.symbol,
+            quantity_to_buy,
+            order_info.expiration_date,
+            order_info.strike,
+            option_type=order_info.call_put,
+            time_in_force='gtc',
+        )
 
     log.append(f'Emergency buy order result: {json.dumps(order_result)}')
+    attempt_id = db.insert_execution_attempt(
+        order_info.order_id, 'emergency', 1, order_result.get('id'), buy_price, quantity_to_buy,
+    )
 
     time.sleep(10)
 
     try:
-        res = r.orders.cancel_option_order(order_result['id'])
+        with tracing.span('cancel'):
+            res = broker.get().cancel_order(order_result['id'])
     except:
         res = ''
         log.append('Error cancelling order after emergency buy fill. Account may have insufficient funds.')
+    db.set_execution_attempt_state(attempt_id, 'cancel_requested')
     msg = (
         'Emergency buy order made. Order did not execute or was cancelled order after 10 seconds.\n' 
         + f'Result of cancellation: {json.dumps(res)}'
@@ -817,11 +1330,8 @@ def execute_buy_emergency_fill(order_info: pd.Series, quantity_to_buy: int, prep
 
     time.sleep(2)
 
-    open_option_positions = r.options.get_open_option_positions()
-    after_emergency_position_quantity = None
-    for open_pos in open_option_positions:
-        if open_pos['option_id'] == order_info['rh_option_uuid']:
-            after_emergency_position_quantity = int(float(open_pos['quantity']))
+    with tracing.span('position_refresh'):
+        after_emergency_position_quantity = positions.book.quantity(order_info.rh_option_uuid, refresh=True)
 
     msg = (
         'Emergency buy. Quantity after emergency buy: '
@@ -834,5 +1344,6 @@ def execute_buy_emergency_fill(order_info: pd.Series, quantity_to_buy: int, prep
     )
 
     log.append(f'{prepend_message} {msg}')
-    pushover.send_notification(f'{prepend_message} {msg}')
+    with tracing.span('notification'):
+        pushover.send_notification(f'{prepend_message} {msg}')
     log.append('Email/text notification sent. Emergency buy fill executed.')
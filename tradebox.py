@@ -1,17 +1,59 @@
 """Flask server for Tradebox API."""
 
 import datetime
+import os
 import sys
+import threading
+import time
 import traceback
 
-from flask import Flask
+from flask import Flask, jsonify, request
 
 import config
+import db
+import jobs
 import log
-import tradeapi
+import pushover
+import quotes
+import recovery
 
 app = Flask(__name__)
 
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def start_background_services() -> None:
+    """Migrate the database and start the background threads, once per process.
+
+    Importing this module has no side effects. gunicorn.conf.py calls
+    this after each worker is forked, and the first request of a
+    process calls it otherwise (for example under 'flask run' or with
+    gunicorn --preload, where threads started in the master would not
+    run in the workers).
+    """
+    global _started_pid
+
+    if _started_pid == os.getpid():
+        return
+
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        db.migrate()
+        # sends notifications left in the outbox by earlier processes
+        pushover.start_sender()
+        # cleans up executions interrupted by a crash or restart
+        recovery.start()
+        # keeps quotes for active orders and open positions fresh for the executors
+        quotes.start_feed()
+        _started_pid = os.getpid()
+
+
+@app.before_request
+def ensure_background_services() -> None:
+    start_background_services()
+
 
 def log_traceback(ex):
     tb_lines = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
@@ -31,29 +73,68 @@ def index() -> str:
 
 
 @app.route('/orders/execute/<order_id>', methods=['POST', 'GET'])
-def execute_order(order_id: int) -> str:
+def execute_order(order_id: int):
     try:
         order_id = int(order_id)
     except ValueError:
         msg = f'tradebox.execute_order({order_id}). order_id: "{order_id}" is not a valid integer.'
         log.append(msg)
 
-        html = 'error'
-        return html
+        return jsonify({'error': f'"{order_id}" is not a valid order id.'}), 400
+
+    try:
+        msg = f'tradebox.py: execute_order(): queueing order_id {order_id}. \n' \
+            + f'Entering jobs.submit({order_id}).'
+        log.append(msg)
+
+        job_id = jobs.submit(order_id)
+
+        response = {
+            'job_id': job_id,
+            'order_id': order_id,
+            'status_url': f'{config.TRADEBOX_APP_ADDRESS}jobs/{job_id}',
+        }
+        return jsonify(response), 202
+    except Exception as ex:
+        log_traceback(ex)
+        return jsonify({'error': f'There was an issue queueing order #{order_id}. Writing traceback to log file.'}), 500
+
+
+@app.route('/orders/execute', methods=['POST'])
+def execute_orders():
+    # accepts {"order_ids": [1, 2, 3]} or [1, 2, 3]
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('order_ids')
 
     try:
-        msg = f'tradebox.py: execute_order(): executing order_id {order_id}. \n' \
-            + f'Entering tradeapi.execute_order({order_id}).'
+        order_ids = [int(order_id) for order_id in payload]
+    except (TypeError, ValueError):
+        msg = f'tradebox.execute_orders(): invalid order id list: {payload}'
         log.append(msg)
+        return jsonify({'error': 'Expected a JSON list of order ids.'}), 400
 
-        tradeapi.execute_order(order_id)
+    try:
+        msg = f'tradebox.py: execute_orders(): executing order_ids {order_ids}. \n' \
+            + f'Entering jobs.run_batch({order_ids}).'
+        log.append(msg)
+
+        start = time.perf_counter()
+        results = jobs.run_batch(order_ids)
+        elapsed_seconds = round(time.perf_counter() - start, 3)
 
-        html = f'Executed order #{order_id}.'
-        return html
+        return jsonify({'results': results, 'elapsed_seconds': elapsed_seconds})
     except Exception as ex:
         log_traceback(ex)
-        html = f'There was an issue executing order #{order_id}. Writing traceback to log file.'
-        return html
+        return jsonify({'error': f'There was an issue executing orders {order_ids}. Writing traceback to log file.'}), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} does not exist.'}), 404
+    return jsonify(job)
 
 
 if __name__ == '__main__':
@@ -71,6 +152,7 @@ if __name__ == '__main__':
     # via gunicorn or other wsgi server
     # this section is not run and config.py has 
     # no effect on server settings.
+    start_background_services()
     app.run(host=config.DEV_IP, 
             port=config.DEV_PORT, 
             debug=config.DEV_DEBUG